@@ -1,5 +1,192 @@
+from urllib.parse import parse_qsl
+
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Prefetch, Q
+from django.utils.functional import cached_property
 
 from .models import Note
+from .purge import BATCH_SIZE, purge_notes, schedule_account_deletion
+
+
+def admin_shard(request):
+    """Шард, выбранный в фильтре списка или сохранённый при переходе."""
+    shard = request.GET.get('shard')
+    if shard is None:
+        preserved = request.GET.get('_changelist_filters', '')
+        shard = dict(parse_qsl(preserved)).get('shard')
+    if shard not in settings.NOTES_SHARDS:
+        shard = settings.NOTES_SHARDS[0]
+    return shard
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    title = 'шард'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in settings.NOTES_SHARDS]
+
+    def queryset(self, request, queryset):
+        # Выбор базы выполняется в ShardedAdminMixin.get_queryset.
+        return queryset
+
+
+class ShardedAdminMixin:
+    """Админка для моделей, данные которых распределены по шардам."""
+
+    def get_list_filter(self, request):
+        list_filter = tuple(super().get_list_filter(request))
+        if len(settings.NOTES_SHARDS) > 1:
+            list_filter = (ShardListFilter,) + list_filter
+        return list_filter
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).using(admin_shard(request))
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор, не считающий все строки большой таблицы.
+
+    Для таблицы без фильтров в PostgreSQL берётся оценка планировщика,
+    в остальных случаях строки считаются не дальше
+    NOTES_ADMIN_COUNT_LIMIT: страницы дальше предела недоступны.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            # До первого ANALYZE оценка отрицательна или равна нулю.
+            if row and row[0] > 0:
+                return int(row[0])
+        limit = settings.NOTES_ADMIN_COUNT_LIMIT
+        return queryset.order_by()[:limit].count()
+
+
+@admin.register(Note)
+class NoteAdmin(ShardedAdminMixin, admin.ModelAdmin):
+    """Админка заметок, работающая быстро на таблицах любого размера.
+
+    Поиск выполняется только по индексам: по id, точному slug и точному
+    имени автора.
+    """
+
+    list_display = ('id', 'title', 'slug', 'author', 'is_deleted')
+    list_filter = ('is_deleted',)
+    list_select_related = ('author',)
+    raw_id_fields = ('author', 'tags')
+    search_fields = ('slug',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('soft_delete_selected', 'restore_selected', 'purge_selected')
+    # Save() не пересчитывает счётчики при смене пометки удаления или
+    # автора: удаление и восстановление выполняются только действиями.
+    readonly_fields = ('is_deleted',)
+
+    def get_readonly_fields(self, request, obj=None):
+        readonly_fields = super().get_readonly_fields(request, obj)
+        if obj is not None:
+            # Заметка лежит в шарде автора вместе с его тегами.
+            readonly_fields += ('author',)
+        return readonly_fields
+
+    def get_queryset(self, request):
+        # В админке видны и удалённые заметки.
+        queryset = Note.all_objects.using(admin_shard(request))
+        if admin_shard(request) != DEFAULT_DB_ALIAS:
+            # Пользователи лежат в default, JOIN с ними в шарде невозможен.
+            queryset = queryset.prefetch_related(Prefetch(
+                'author',
+                queryset=get_user_model().objects.using(DEFAULT_DB_ALIAS),
+            ))
+        return queryset
+
+    def get_list_select_related(self, request):
+        if admin_shard(request) != DEFAULT_DB_ALIAS:
+            # Пустой кортеж, а не False: иначе Django сам добавит JOIN.
+            return ()
+        return super().get_list_select_related(request)
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        condition = Q(slug=search_term)
+        if search_term.isdigit():
+            condition |= Q(pk=int(search_term))
+        user_model = get_user_model()
+        author_ids = list(user_model.objects.using(DEFAULT_DB_ALIAS).filter(
+            **{user_model.USERNAME_FIELD: search_term}
+        ).values_list('pk', flat=True))
+        if author_ids:
+            condition |= Q(author_id__in=author_ids)
+        return queryset.filter(condition), False
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Стандартное удаление загружает в память все выбранные объекты.
+        actions.pop('delete_selected', None)
+        return actions
+
+    def batches(self, queryset):
+        """Разбивает выбранные заметки на порции id по BATCH_SIZE."""
+        ids = queryset.order_by('pk').values_list('pk', flat=True)
+        last_pk = 0
+        while True:
+            batch = list(ids.filter(pk__gt=last_pk)[:BATCH_SIZE])
+            if not batch:
+                return
+            last_pk = batch[-1]
+            yield queryset.model.all_objects.using(queryset.db).filter(
+                pk__in=batch
+            )
+
+    @admin.action(description='Пометить выбранные заметки удалёнными')
+    def soft_delete_selected(self, request, queryset):
+        deleted = sum(batch.soft_delete() for batch in self.batches(queryset))
+        self.message_user(request, f'Помечено удалёнными: {deleted}.')
+
+    @admin.action(description='Восстановить выбранные заметки')
+    def restore_selected(self, request, queryset):
+        restored = sum(batch.restore() for batch in self.batches(queryset))
+        self.message_user(request, f'Восстановлено: {restored}.')
+
+    @admin.action(description='Окончательно удалить выбранные удалённые')
+    def purge_selected(self, request, queryset):
+        deleted = purge_notes(queryset.filter(is_deleted=True))
+        self.message_user(request, f'Удалено заметок: {deleted}.')
+
+
+admin.site.unregister(get_user_model())
+
+
+@admin.register(get_user_model())
+class AccountDeletionUserAdmin(UserAdmin):
+    """Удаление пользователей через очередь purge_notes.
+
+    Пользователь сразу отключается, а его заметки и сам аккаунт
+    удаляются позже небольшими порциями.
+    """
+
+    def get_deleted_objects(self, objs, request):
+        # Связанные объекты не собираются: их может быть очень много.
+        return [str(obj) for obj in objs], {}, set(), []
+
+    def delete_model(self, request, obj):
+        schedule_account_deletion(obj)
 
-admin.site.register(Note)
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            schedule_account_deletion(user)
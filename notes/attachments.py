@@ -0,0 +1,195 @@
+"""Хранение вложений заметок на локальном диске.
+
+Файлы лежат по адресу, вычисленному из SHA-256 содержимого, поэтому
+одинаковые вложения хранятся на диске один раз. Все операции читают и
+пишут данные блоками, не загружая файл в память целиком.
+
+Файл, на который перестали ссылаться, удаляет задача release_blob.
+Чтобы она не удалила файл, который в это время получает новую ссылку,
+commit_blob и задача работают под общей блокировкой blob_lock, а задача
+не трогает файлы, изменённые за последние NOTES_ATTACHMENTS_BLOB_GRACE
+секунд: за это время запись о новом вложении успевает сохраниться.
+"""
+import hashlib
+import os
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:
+    # На Windows остаётся только защита по времени изменения файла.
+    fcntl = None
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+def attachments_root():
+    """Корневая директория хранилища вложений."""
+    return Path(settings.NOTES_ATTACHMENTS_ROOT)
+
+
+def blob_path(sha256):
+    """Путь к файлу с заданным хешем содержимого."""
+    return attachments_root() / sha256[:2] / sha256[2:4] / sha256
+
+
+def upload_path(upload_id):
+    """Путь к временному файлу незавершённой загрузки."""
+    return attachments_root() / 'uploads' / f'{upload_id}.part'
+
+
+@contextmanager
+def blob_lock():
+    """Блокировка хранилища, общая для всех процессов."""
+    path = attachments_root() / '.lock'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def blob_age(sha256):
+    """Секунды с последнего изменения файла или None, если его нет."""
+    try:
+        modified = blob_path(sha256).stat().st_mtime
+    except FileNotFoundError:
+        return None
+    return time.time() - modified
+
+
+def append_chunk(path, offset, stream, length):
+    """Записывает length байт из stream в файл начиная с offset."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    mode = 'r+b' if path.exists() else 'wb'
+    written = 0
+    with open(path, mode) as destination:
+        destination.seek(offset)
+        destination.truncate()
+        while written < length:
+            data = stream.read(min(CHUNK_SIZE, length - written))
+            if not data:
+                break
+            destination.write(data)
+            written += len(data)
+    return written
+
+
+def hash_file(path):
+    """Считает SHA-256 файла, читая его блоками."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for data in iter(lambda: source.read(CHUNK_SIZE), b''):
+            digest.update(data)
+    return digest.hexdigest()
+
+
+def commit_blob(path, sha256=None):
+    """Переносит готовый файл в хранилище и возвращает его хеш.
+
+    Если файл с таким содержимым уже есть, временный файл удаляется,
+    а время изменения существующего обновляется, чтобы release_blob
+    не удалил его до сохранения ссылающейся записи.
+    """
+    sha256 = sha256 or hash_file(path)
+    destination = blob_path(sha256)
+    with blob_lock():
+        if destination.exists():
+            os.utime(destination)
+            path.unlink()
+        else:
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(path, destination)
+    return sha256
+
+
+def store_uploaded_file(uploaded_file):
+    """Сохраняет загруженный через форму файл; возвращает (хеш, размер)."""
+    path = upload_path(uuid.uuid4())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as destination:
+        for data in uploaded_file.chunks(CHUNK_SIZE):
+            digest.update(data)
+            destination.write(data)
+            size += len(data)
+    return commit_blob(path, digest.hexdigest()), size
+
+
+def remove_blob(sha256):
+    """Удаляет файл из хранилища, если он там есть."""
+    blob_path(sha256).unlink(missing_ok=True)
+
+
+def content_disposition(filename):
+    """Заголовок Content-Disposition для скачивания файла."""
+    try:
+        filename.encode('ascii')
+    except UnicodeEncodeError:
+        return f"attachment; filename*=utf-8''{quote(filename)}"
+    escaped = filename.replace('\\', '\\\\').replace('"', r'\"')
+    return f'attachment; filename="{escaped}"'
+
+
+def parse_range(header, size):
+    """Разбирает заголовок Range для одного диапазона.
+
+    Возвращает пару (start, end) включительно или None, если заголовок
+    отсутствует или не поддерживается. Для недостижимого диапазона
+    выбрасывает ValueError.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Суффиксный диапазон: последние N байт.
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def parse_content_range(header):
+    """Разбирает Content-Range загружаемого блока в (start, end, total)."""
+    match = CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise ValueError(header)
+    start, end, total = map(int, match.groups())
+    if start > end or end >= total:
+        raise ValueError(header)
+    return start, end, total
+
+
+class RangeFileWrapper:
+    """Файлоподобный объект, отдающий только часть файла."""
+
+    def __init__(self, filelike, start, length):
+        self.filelike = filelike
+        self.remaining = length
+        filelike.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.filelike.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.filelike.close()
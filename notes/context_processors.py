@@ -0,0 +1,16 @@
+from django.utils.functional import SimpleLazyObject
+
+from .models import UserStats
+
+
+def note_stats(request):
+    """Счётчики заметок текущего пользователя для шапки сайта.
+
+    Запрос к базе выполняется, только если шаблон их использует.
+    """
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return {}
+    return {
+        'note_stats': SimpleLazyObject(lambda: UserStats.for_user(user.pk))
+    }
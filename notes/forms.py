@@ -1,20 +1,86 @@
+import re
+
 from pytils.translit import slugify
 
 from django import forms
 from django.core.exceptions import ValidationError
 
-from .models import Note
+from . import search, sharding
+from .models import AttachmentUpload, Note, Tag
 
 WARNING = ' - такой slug уже существует, придумайте уникальное значение!'
+TAG_SEPARATORS = re.compile(r'[\s,]+')
+
+
+def parse_tags(value):
+    """Разбирает строку вида «#работа, идеи» в список имён тегов."""
+    names = (
+        name.lstrip('#').lower() for name in TAG_SEPARATORS.split(value)
+    )
+    return list(dict.fromkeys(name for name in names if name))
 
 
 class NoteForm(forms.ModelForm):
     """Форма для создания или обновления заметки."""
 
+    tags = forms.CharField(
+        label='Теги',
+        required=False,
+        help_text='Перечислите теги через запятую или пробел',
+    )
+
     class Meta:
         model = Note
         fields = ('title', 'text', 'slug')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial.setdefault('tags', ', '.join(
+                tag.name for tag in self.instance.tags.all()
+            ))
+
+    def slug_taken(self, alias, slug):
+        """Занят ли slug в шарде (slug уникален во всех шардах)."""
+        notes = Note.all_objects.using(alias).filter(slug=slug)
+        if self.instance.pk and sharding.shard_for(
+                self.instance.author_id
+        ) == alias:
+            notes = notes.exclude(id=self.instance.pk)
+        return notes.exists()
+
+    def clean_text(self):
+        """Находит похожие заметки автора; сохранению они не мешают.
+
+        Автор берётся из instance, поэтому для новой заметки представление
+        передаёт Note с заполненным автором.
+        """
+        text = self.cleaned_data['text']
+        self.duplicates = []
+        if self.instance.author_id and 'text' in self.changed_data:
+            notes = Note.objects.for_author(self.instance.author_id)
+            if self.instance.pk:
+                notes = notes.exclude(pk=self.instance.pk)
+            self.duplicates = search.find_duplicates(
+                notes, self.instance.author_id, text
+            )
+        return text
+
+    def clean_tags(self):
+        """Проверяет длину имён тегов."""
+        names = parse_tags(self.cleaned_data['tags'])
+        max_length = Tag._meta.get_field('name').max_length
+        too_long = [name for name in names if len(name) > max_length]
+        if too_long:
+            raise ValidationError(
+                f'Тег длиннее {max_length} символов: {too_long[0]}'
+            )
+        return names
+
+    def _save_m2m(self):
+        super()._save_m2m()
+        self.instance.set_tags(self.cleaned_data['tags'])
+
     def clean_slug(self):
         """Обрабатывает случай, если slug не уникален."""
         cleaned_data = super().clean()
@@ -22,8 +88,27 @@ class NoteForm(forms.ModelForm):
         if not slug:
             title = cleaned_data.get('title')
             slug = slugify(title)[:100]
-        if Note.objects.filter(
-                slug=slug
-        ).exclude(id=self.instance.pk).exists():
+        if any(self.slug_taken(alias, slug) for alias in sharding.shards()):
             raise ValidationError(slug + WARNING)
         return slug
+
+
+class AttachmentForm(forms.Form):
+    """Форма для прикрепления файла к заметке."""
+
+    file = forms.FileField(label='Файл')
+
+
+class AttachmentUploadForm(forms.ModelForm):
+    """Форма для начала загрузки вложения по частям."""
+
+    class Meta:
+        model = AttachmentUpload
+        fields = ('name', 'size')
+
+    def clean_size(self):
+        """Пустые файлы загружать по частям незачем."""
+        size = self.cleaned_data['size']
+        if not size:
+            raise ValidationError('Размер файла должен быть больше нуля.')
+        return size
@@ -0,0 +1,199 @@
+"""Фоновые задачи без внешнего брокера.
+
+Очередь хранится в таблице Task базы default. Задача ставится в очередь
+после фиксации транзакции одним INSERT, поэтому запрос не ждёт её
+выполнения. Воркеры (manage.py run_workers) забирают задачи оптимистичным
+UPDATE, при ошибке повторяют их с экспоненциальной задержкой.
+
+Задачи регистрируются декоратором task в модулях tasks.py приложений::
+
+    @task('notes.release_blob')
+    def release_blob(sha256):
+        ...
+
+    release_blob.enqueue(key=f'release-blob:{sha256}', sha256=sha256)
+
+Пока задача с ключом идемпотентности ждёт выполнения, повторная
+постановка с тем же ключом игнорируется.
+"""
+import logging
+import random
+import threading
+import traceback
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import (
+    DEFAULT_DB_ALIAS, IntegrityError, close_old_connections, connections,
+    transaction
+)
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+registry = {}
+
+
+def task(name, max_attempts=None):
+    """Регистрирует функцию как фоновую задачу с именем name."""
+    def decorator(func):
+        registry[name] = func
+        func.task_name = name
+        func.enqueue = partial(enqueue, name, max_attempts=max_attempts)
+        return func
+    return decorator
+
+
+def enqueue(name, key=None, delay=0, max_attempts=None, using=None,
+            **kwargs):
+    """Ставит задачу в очередь после фиксации текущей транзакции.
+
+    using — база, транзакции которой нужно дождаться (по умолчанию
+    default). Аргументы задачи должны сериализоваться в JSON.
+    """
+    if name not in registry:
+        raise KeyError(f'Задача {name} не зарегистрирована.')
+    new_task = Task(
+        name=name,
+        kwargs=kwargs,
+        idempotency_key=key,
+        max_attempts=max_attempts or settings.NOTES_TASK_MAX_ATTEMPTS,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+    transaction.on_commit(
+        partial(
+            Task.objects.using(DEFAULT_DB_ALIAS).bulk_create,
+            [new_task],
+            ignore_conflicts=True,
+        ),
+        using=using,
+    )
+
+
+def backoff(attempts):
+    """Задержка перед повтором: экспонента с ограничением и разбросом."""
+    delay = min(
+        settings.NOTES_TASK_RETRY_BASE * 2 ** (attempts - 1),
+        settings.NOTES_TASK_RETRY_MAX,
+    )
+    return delay * random.uniform(0.5, 1)
+
+
+def queue():
+    return Task.objects.using(DEFAULT_DB_ALIAS)
+
+
+def requeue_stale():
+    """Возвращает в очередь задачи воркеров, завершившихся аварийно.
+
+    Если такая же задача уже ждёт в очереди, зависшая удаляется.
+    """
+    deadline = timezone.now() - timedelta(
+        seconds=settings.NOTES_TASK_STALE_TIMEOUT
+    )
+    stale = list(queue().filter(
+        status=Task.RUNNING, locked_at__lt=deadline
+    ).values_list('pk', flat=True))
+    requeued = 0
+    for pk in stale:
+        try:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                requeued += queue().filter(
+                    pk=pk, status=Task.RUNNING
+                ).update(status=Task.PENDING)
+        except IntegrityError:
+            queue().filter(pk=pk).delete()
+    return requeued
+
+
+def claim():
+    """Забирает одну готовую к выполнению задачу или возвращает None."""
+    now = timezone.now()
+    candidates = queue().filter(
+        status=Task.PENDING, run_at__lte=now
+    ).order_by('run_at').values_list('pk', flat=True)[:10]
+    for pk in candidates:
+        # Задачу получит тот воркер, чей UPDATE изменит строку.
+        if queue().filter(pk=pk, status=Task.PENDING).update(
+                status=Task.RUNNING,
+                locked_at=now,
+                attempts=F('attempts') + 1,
+        ):
+            return queue().get(pk=pk)
+    return None
+
+
+def run(claimed):
+    """Выполняет задачу; возвращает True при успехе."""
+    try:
+        registry[claimed.name](**claimed.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning('Задача %s #%s завершилась ошибкой:\n%s',
+                       claimed.name, claimed.pk, error)
+        claimed.last_error = error
+        if claimed.attempts >= claimed.max_attempts:
+            claimed.status = Task.FAILED
+        else:
+            claimed.status = Task.PENDING
+            claimed.run_at = timezone.now() + timedelta(
+                seconds=backoff(claimed.attempts)
+            )
+        try:
+            with transaction.atomic(using=DEFAULT_DB_ALIAS):
+                claimed.save(
+                    update_fields=('status', 'run_at', 'last_error')
+                )
+        except IntegrityError:
+            # Такая же задача уже ждёт в очереди и выполнит эту работу.
+            claimed.delete()
+        return False
+    claimed.delete()
+    return True
+
+
+def drain():
+    """Выполняет все готовые задачи в текущем потоке."""
+    done = 0
+    while True:
+        claimed = claim()
+        if claimed is None:
+            return done
+        run(claimed)
+        done += 1
+
+
+def work(stop, poll_interval):
+    """Цикл воркера: выполняет задачи, пока не установлен stop."""
+    while not stop.is_set():
+        try:
+            close_old_connections()
+            claimed = claim()
+            if claimed is None:
+                requeue_stale()
+                stop.wait(poll_interval)
+            else:
+                run(claimed)
+        except Exception:
+            # Ошибка базы не должна останавливать поток воркера.
+            logger.exception('Ошибка в цикле воркера.')
+            stop.wait(poll_interval)
+    connections.close_all()
+
+
+def start_workers(threads, poll_interval):
+    """Запускает пул потоков-воркеров; возвращает (stop, потоки)."""
+    stop = threading.Event()
+    workers = [
+        threading.Thread(
+            target=work, args=(stop, poll_interval),
+            name=f'notes-worker-{number}', daemon=True,
+        )
+        for number in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    return stop, workers
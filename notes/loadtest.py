@@ -0,0 +1,210 @@
+"""Воспроизведение записанного трафика для нагрузочного тестирования.
+
+Трасса записывается TraceRecordingMiddleware. Запросы отправляются
+на запущенный сервер (yanote.wsgi или yanote.asgi) в тех же интервалах,
+что и при записи, сжатых в speed раз. Записанные пользователи
+сопоставляются с тестовыми пользователями, от имени которых идут
+запросы.
+
+Тела запросов не записываются. POST-запросы маршрутов из FORM_BODIES
+воспроизводятся со сгенерированными формами (например, каждый
+notes:add создаёт на сервере новую заметку). Остальные изменяющие
+запросы и маршруты со скрытыми в трассе секретами пропускаются; их
+перечисляет skipped.
+"""
+import asyncio
+import json
+import random
+import secrets
+import string
+import time
+import uuid
+from collections import Counter, defaultdict
+from urllib.parse import urlencode, urlsplit
+
+from .middleware import SAFE_METHODS, TRACE_SECRET_KWARGS
+
+ERROR = 'error'
+CSRF_ALLOWED_CHARS = string.ascii_letters + string.digits
+LOAD_TEXT = ('Заметка, созданная при воспроизведении трафика. '
+             'Купить молоко, хлеб и сыр, позвонить маме, закончить отчёт.')
+
+
+def note_form():
+    """Форма notes:add с уникальным адресом заметки."""
+    return {
+        'title': 'Нагрузочный тест',
+        'text': LOAD_TEXT,
+        'slug': f'load-{uuid.uuid4().hex}',
+    }
+
+
+def login_form():
+    """Форма users:login с неверным паролем.
+
+    Хеш пароля проверяется и для несуществующего пользователя, поэтому
+    запрос нагружает сервер так же, как настоящий вход.
+    """
+    return {'username': 'load-test', 'password': secrets.token_hex(8)}
+
+
+# Генераторы тел для POST-запросов, которые можно воспроизвести.
+FORM_BODIES = {'notes:add': note_form, 'users:login': login_form}
+
+
+def replayable(entry):
+    """Можно ли воспроизвести запрос из записи трассы."""
+    if entry['route'] in TRACE_SECRET_KWARGS:
+        return False
+    return entry['method'] in SAFE_METHODS or (
+        entry['method'] == 'POST' and entry['route'] in FORM_BODIES
+    )
+
+
+def skipped(entries):
+    """Невоспроизводимые записи: {(метод, имя URL): количество}."""
+    return Counter(
+        (entry['method'], entry['route'])
+        for entry in entries if not replayable(entry)
+    )
+
+
+def csrf_token():
+    """Случайный CSRF-токен, который примет CsrfViewMiddleware."""
+    return ''.join(secrets.choice(CSRF_ALLOWED_CHARS) for _ in range(64))
+
+
+def read_trace(path):
+    """Записи трассы, упорядоченные по времени."""
+    with open(path, encoding='utf-8') as trace:
+        entries = [json.loads(line) for line in trace if line.strip()]
+    return sorted(entries, key=lambda entry: entry['time'])
+
+
+def assign_cookies(entries, cookies, anonymous=0.0, seed=0):
+    """Выбирает cookie сессии для каждой записи.
+
+    Записанный пользователь всегда получает одну и ту же сессию из
+    cookies; доля anonymous запросов пользователей идёт без сессии.
+    """
+    chooser = random.Random(seed)
+    assigned = []
+    for entry in entries:
+        user = entry['user']
+        if user is None or not cookies or chooser.random() < anonymous:
+            assigned.append(None)
+        else:
+            assigned.append(cookies[user % len(cookies)])
+    return assigned
+
+
+async def fetch(host, port, method, path, cookie, timeout, body=None):
+    """Отправляет HTTP/1.1-запрос и возвращает код ответа.
+
+    body — байты формы application/x-www-form-urlencoded.
+    """
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port), timeout
+    )
+    try:
+        headers = [
+            f'{method} {path} HTTP/1.1',
+            f'Host: {host}:{port}',
+            'Connection: close',
+        ]
+        if cookie:
+            headers.append(f'Cookie: {cookie}')
+        if body is not None:
+            headers.append('Content-Type: application/x-www-form-urlencoded')
+            headers.append(f'Content-Length: {len(body)}')
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1'))
+        if body is not None:
+            writer.write(body)
+        await writer.drain()
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        # Ответ дочитывается, чтобы учесть время передачи тела.
+        while await asyncio.wait_for(reader.read(64 * 1024), timeout):
+            pass
+    finally:
+        writer.close()
+    return int(status_line.split()[1])
+
+
+async def replay(entries, base_url, speed=1.0, concurrency=100,
+                 cookies=(), anonymous=0.0, timeout=30.0, seed=0,
+                 csrf_cookie='csrftoken'):
+    """Воспроизводит записи; возвращает (результаты, длительность).
+
+    Результат — тройка (имя URL, код ответа или ERROR, задержка в
+    секундах). Невоспроизводимые записи (см. replayable) пропускаются.
+    """
+    entries = [entry for entry in entries if replayable(entry)]
+    if not entries:
+        return [], 0.0
+    url = urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    prefix = url.path.rstrip('/')
+    limit = asyncio.Semaphore(concurrency)
+    results = []
+
+    async def send(entry, cookie, delay):
+        body = None
+        if entry['method'] not in SAFE_METHODS:
+            form = FORM_BODIES[entry['route']]()
+            form['csrfmiddlewaretoken'] = token = csrf_token()
+            body = urlencode(form).encode()
+            cookie = '; '.join(filter(None, (
+                cookie, f'{csrf_cookie}={token}'
+            )))
+        await asyncio.sleep(delay)
+        async with limit:
+            started = time.perf_counter()
+            try:
+                status = await fetch(
+                    host, port, entry['method'], prefix + entry['path'],
+                    cookie, timeout, body,
+                )
+            except (OSError, ValueError, IndexError, asyncio.TimeoutError):
+                status = ERROR
+            results.append(
+                (entry['route'], status, time.perf_counter() - started)
+            )
+
+    first = entries[0]['time']
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        send(entry, cookie, (entry['time'] - first) / speed)
+        for entry, cookie in zip(
+            entries, assign_cookies(entries, cookies, anonymous, seed)
+        )
+    ))
+    return results, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    """Перцентиль отсортированного списка."""
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def report(results, elapsed):
+    """Сводка по маршрутам: {имя URL: показатели}, самые частые первыми."""
+    routes = defaultdict(list)
+    for route, status, latency in results:
+        routes[route or '(не найден)'].append((status, latency))
+    summary = {}
+    for route, samples in sorted(
+            routes.items(), key=lambda item: -len(item[1])
+    ):
+        latencies = sorted(latency for _, latency in samples)
+        summary[route] = {
+            'requests': len(samples),
+            'errors': sum(
+                status == ERROR or status >= 500 for status, _ in samples
+            ),
+            'rps': len(samples) / elapsed if elapsed else 0.0,
+            'p50': percentile(latencies, 0.5),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': latencies[-1],
+        }
+    return summary
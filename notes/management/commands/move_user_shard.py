@@ -0,0 +1,65 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from notes import sharding
+from notes.models import ShardAssignment
+from notes.purge import BATCH_SIZE, PAUSE
+
+
+class Command(BaseCommand):
+    help = ('Переносит данные пользователя в другой шард без остановки '
+            'сервиса или закрепляет текущее размещение всех пользователей.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', nargs='?')
+        parser.add_argument('shard', nargs='?')
+        parser.add_argument(
+            '--pin-all', action='store_true',
+            help=('Записать в справочник текущий шард всех пользователей. '
+                  'Выполните перед изменением NOTES_SHARDS.'),
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Количество заметок, копируемых за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=PAUSE,
+            help='Пауза между порциями в секундах.',
+        )
+
+    def handle(self, *args, **options):
+        if options['pin_all']:
+            return self.pin_all()
+        if not options['username'] or not options['shard']:
+            raise CommandError('Укажите пользователя и целевой шард.')
+        user_model = get_user_model()
+        try:
+            user = user_model.objects.get(
+                **{user_model.USERNAME_FIELD: options['username']}
+            )
+        except user_model.DoesNotExist:
+            raise CommandError(
+                f'Пользователь {options["username"]} не найден.'
+            )
+        try:
+            moved = sharding.move_user(
+                user.pk, options['shard'],
+                options['batch_size'], options['pause'],
+            )
+        except ValueError as error:
+            raise CommandError(error)
+        self.stdout.write(f'Перенесено заметок: {moved}.')
+
+    def pin_all(self):
+        directory = ShardAssignment.objects.using(DEFAULT_DB_ALIAS)
+        pinned = set(directory.values_list('user_id', flat=True))
+        user_ids = get_user_model().objects.values_list('pk', flat=True)
+        assignments = [
+            ShardAssignment(
+                user_id=user_id, shard=sharding.hashed_shard(user_id)
+            )
+            for user_id in user_ids if user_id not in pinned
+        ]
+        directory.bulk_create(assignments, batch_size=1000)
+        self.stdout.write(f'Закреплено пользователей: {len(assignments)}.')
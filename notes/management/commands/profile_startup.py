@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+SCRIPT = '''
+import logging, sys
+logging.basicConfig(level=logging.INFO, stream=sys.stdout,
+                    format='%(message)s')
+import {module}
+'''
+
+
+class Command(BaseCommand):
+    help = ('Запускает WSGI-приложение в отдельном процессе и показывает, '
+            'сколько времени занимают импорты и прогрев.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=15,
+            help='Количество самых медленных модулей в отчёте.',
+        )
+
+    def handle(self, *args, **options):
+        module = settings.WSGI_APPLICATION.rsplit('.', 1)[0]
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c',
+             SCRIPT.format(module=module)],
+            capture_output=True, text=True,
+            env={**os.environ,
+                 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE},
+        )
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+        imports = self.parse(result.stderr)
+        packages = defaultdict(int)
+        for name, own, _ in imports:
+            packages[name.split('.')[0]] += own
+        self.stdout.write(
+            f'Импорт {module} с прогревом: '
+            f'{sum(own for _, own, _ in imports) / 1000:.1f} мс, '
+            f'модулей: {len(imports)}.'
+        )
+        self.stdout.write('Пакеты (собственное время импорта):')
+        for name, own in sorted(
+                packages.items(), key=lambda item: -item[1]
+        )[:options['top']]:
+            self.stdout.write(f'  {own / 1000:8.1f} мс  {name}')
+        self.stdout.write('Модули (вместе с вложенными импортами):')
+        for name, _, cumulative in sorted(
+                imports, key=lambda item: -item[2]
+        )[:options['top']]:
+            self.stdout.write(f'  {cumulative / 1000:8.1f} мс  {name}')
+        self.stdout.write(result.stdout.strip())
+
+    def parse(self, output):
+        """Разбирает вывод -X importtime: (модуль, своё, общее время, мкс)."""
+        imports = []
+        for line in output.splitlines():
+            if not line.startswith('import time:') or '[us]' in line:
+                continue
+            own, cumulative, name = line[len('import time:'):].split('|')
+            imports.append((name.strip(), int(own), int(cumulative)))
+        return imports
@@ -0,0 +1,49 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from notes.purge import BATCH_SIZE, PAUSE, purge, schedule_account_deletion
+
+
+class Command(BaseCommand):
+    help = ('Удаляет помеченные заметки, аккаунты из очереди удаления '
+            'и брошенные загрузки вложений небольшими порциями.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Количество заметок, удаляемых за одну транзакцию.',
+        )
+        parser.add_argument(
+            '--pause', type=float, default=PAUSE,
+            help='Пауза между порциями в секундах.',
+        )
+        parser.add_argument(
+            '--schedule-account', action='append', default=[],
+            metavar='USERNAME',
+            help='Поставить пользователя в очередь на удаление.',
+        )
+        parser.add_argument(
+            '--interval', type=float,
+            help='Не завершаться, а повторять очистку с этим интервалом.',
+        )
+
+    def handle(self, *args, **options):
+        user_model = get_user_model()
+        for username in options['schedule_account']:
+            try:
+                user = user_model.objects.get(
+                    **{user_model.USERNAME_FIELD: username}
+                )
+            except user_model.DoesNotExist:
+                raise CommandError(f'Пользователь {username} не найден.')
+            schedule_account_deletion(user)
+        while True:
+            notes, users = purge(options['batch_size'], options['pause'])
+            self.stdout.write(
+                f'Удалено заметок: {notes}, пользователей: {users}.'
+            )
+            if options['interval'] is None:
+                return
+            time.sleep(options['interval'])
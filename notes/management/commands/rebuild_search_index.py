@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from notes import search, sharding
+from notes.models import Note
+
+
+class Command(BaseCommand):
+    help = ('Перестраивает индексы нечёткого поиска по заголовкам и '
+            'поиска похожих заметок.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Количество заметок, индексируемых за одну транзакцию.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+        for alias in sharding.shards():
+            notes = Note.all_objects.using(alias).order_by('pk')
+            last_pk = 0
+            while True:
+                batch = list(notes.filter(pk__gt=last_pk)[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                with transaction.atomic(using=alias):
+                    for note in batch:
+                        search.index_note(note, alias)
+                total += len(batch)
+        self.stdout.write(f'Проиндексировано заметок: {total}.')
@@ -0,0 +1,76 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from django.db.models import Count, F, Q
+
+from notes import sharding
+from notes.models import Note, Tag, UserStats
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики заметок пользователей и тегов и '
+            'исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество пользователей, проверяемых за раз.',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = list(
+            get_user_model().objects.order_by('pk').values_list(
+                'pk', flat=True
+            )
+        )
+        batch_size = options['batch_size']
+        using = router.db_for_write(UserStats)
+        fixed = 0
+        for start in range(0, len(user_ids), batch_size):
+            with transaction.atomic(using=using):
+                fixed += self.reconcile(
+                    using, user_ids[start:start + batch_size]
+                )
+        self.stdout.write(f'Исправлено записей: {fixed}.')
+
+    def reconcile(self, using, user_ids):
+        # Счётчики блокируются в основной базе до подсчёта заметок:
+        # изменения от заметок, созданных во время подсчёта, дождутся
+        # конца транзакции и не будут перезаписаны старым числом.
+        stored = UserStats.objects.using(using).select_for_update().in_bulk(
+            user_ids
+        )
+        actual = {}
+        for alias in sharding.shards():
+            actual.update(Note.objects.using(alias).filter(
+                author_id__in=user_ids
+            ).stats_by_author())
+        to_create, to_update = [], []
+        for user_id in user_ids:
+            notes, length = actual.get(user_id, (0, 0))
+            stats = stored.get(user_id)
+            if stats is None:
+                to_create.append(UserStats(
+                    user_id=user_id, note_count=notes, text_length=length
+                ))
+            elif (stats.note_count, stats.text_length) != (notes, length):
+                stats.note_count, stats.text_length = notes, length
+                to_update.append(stats)
+        UserStats.objects.using(using).bulk_create(to_create)
+        UserStats.objects.using(using).bulk_update(
+            to_update, ('note_count', 'text_length')
+        )
+        return len(to_create) + len(to_update) + sum(
+            self.reconcile_tags(alias, user_ids) for alias in sharding.shards()
+        )
+
+    def reconcile_tags(self, alias, user_ids):
+        tags = list(
+            Tag.objects.using(alias).filter(author_id__in=user_ids).annotate(
+                actual=Count('notes', filter=Q(notes__is_deleted=False))
+            ).exclude(note_count=F('actual'))
+        )
+        for tag in tags:
+            tag.note_count = tag.actual
+        Tag.objects.using(alias).bulk_update(tags, ('note_count',))
+        return len(tags)
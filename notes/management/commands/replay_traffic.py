@@ -0,0 +1,116 @@
+import asyncio
+
+from django.conf import settings
+from django.contrib.auth import (
+    BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+)
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import get_resolver
+
+from notes import loadtest
+
+NAMESPACES = ('notes', 'users')
+
+
+class Command(BaseCommand):
+    help = ('Воспроизводит записанный TraceRecordingMiddleware трафик на '
+            'запущенном сервере и выводит отчёт по маршрутам. Запросы '
+            'notes:add создают на сервере заметки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('trace', help='Файл трассы (NOTES_TRACE_FILE).')
+        parser.add_argument(
+            '--base-url', default='http://127.0.0.1:8000',
+            help='Адрес сервера, на который отправляются запросы.',
+        )
+        parser.add_argument(
+            '--speed', type=float, default=1.0,
+            help='Во сколько раз сжать интервалы между запросами.',
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=100,
+            help='Максимум одновременных запросов.',
+        )
+        parser.add_argument(
+            '--user', action='append', default=[], metavar='USERNAME',
+            help=('Пользователь, от имени которого идут запросы '
+                  'записанных пользователей; можно указать несколько.'),
+        )
+        parser.add_argument(
+            '--anonymous', type=float, default=0.0,
+            help='Доля запросов пользователей, отправляемых без входа.',
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=30.0,
+            help='Таймаут одного запроса в секундах.',
+        )
+
+    def handle(self, *args, **options):
+        if options['speed'] <= 0:
+            raise CommandError('--speed должен быть больше нуля.')
+        entries = loadtest.read_trace(options['trace'])
+        results, elapsed = asyncio.run(loadtest.replay(
+            entries,
+            options['base_url'],
+            speed=options['speed'],
+            concurrency=options['concurrency'],
+            cookies=[self.login(name) for name in options['user']],
+            anonymous=options['anonymous'],
+            timeout=options['timeout'],
+            csrf_cookie=settings.CSRF_COOKIE_NAME,
+        ))
+        self.stdout.write(
+            f'Отправлено запросов: {len(results)} из {len(entries)} '
+            f'за {elapsed:.1f} с.'
+        )
+        skipped = loadtest.skipped(entries)
+        if skipped:
+            # Тела запросов не записываются, а секреты в адресах скрыты.
+            self.stdout.write('Не воспроизведены: ' + ', '.join(
+                f'{method} {route} ({count})'
+                for (method, route), count in skipped.most_common()
+            ))
+        summary = loadtest.report(results, elapsed)
+        self.stdout.write(
+            f'{"маршрут":<24}{"запросы":>9}{"ошибки":>8}{"rps":>9}'
+            f'{"p50, мс":>10}{"p95, мс":>10}{"p99, мс":>10}{"max, мс":>10}'
+        )
+        for route, row in summary.items():
+            self.stdout.write(
+                f'{route:<24}{row["requests"]:>9}{row["errors"]:>8}'
+                f'{row["rps"]:>9.1f}' + ''.join(
+                    f'{row[key] * 1000:>10.1f}'
+                    for key in ('p50', 'p95', 'p99', 'max')
+                )
+            )
+        missing = sorted(self.routes() - set(summary))
+        if missing:
+            self.stdout.write('Без запросов: ' + ', '.join(missing))
+
+    def login(self, username):
+        """Создаёт сессию пользователя и возвращает cookie для неё."""
+        user_model = get_user_model()
+        try:
+            user = user_model.objects.get(
+                **{user_model.USERNAME_FIELD: username}
+            )
+        except user_model.DoesNotExist:
+            raise CommandError(f'Пользователь {username} не найден.')
+        session = SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return f'{settings.SESSION_COOKIE_NAME}={session.session_key}'
+
+    def routes(self):
+        """Имена маршрутов notes.urls и yanote.urls."""
+        names = set()
+        for namespace in NAMESPACES:
+            _, resolver = get_resolver().namespace_dict[namespace]
+            names.update(
+                f'{namespace}:{key}' for key in resolver.reverse_dict
+                if isinstance(key, str)
+            )
+        return names
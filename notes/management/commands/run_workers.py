@@ -0,0 +1,42 @@
+import signal
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import autodiscover_modules
+
+from notes import jobs
+
+
+class Command(BaseCommand):
+    help = 'Запускает воркеры, выполняющие фоновые задачи из очереди.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help='Количество потоков-воркеров в процессе.',
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Пауза в секундах, если очередь пуста.',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и завершиться.',
+        )
+
+    def handle(self, *args, **options):
+        autodiscover_modules('tasks')
+        jobs.requeue_stale()
+        if options['once']:
+            done = jobs.drain()
+            self.stdout.write(f'Выполнено задач: {done}.')
+            return
+        stop, workers = jobs.start_workers(
+            options['threads'], options['poll_interval']
+        )
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stop.set())
+        self.stdout.write(f'Запущено воркеров: {len(workers)}.')
+        # Главный поток ждёт сигнала, пока воркеры выполняют задачи.
+        while any(worker.is_alive() for worker in workers):
+            for worker in workers:
+                worker.join(timeout=1)
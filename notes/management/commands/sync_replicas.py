@@ -0,0 +1,31 @@
+import sqlite3
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную SQLite-базу в файлы реплик. Нужна для '
+            'локальной проверки работы с репликами.')
+
+    def handle(self, *args, **options):
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Копирование поддерживается только для SQLite.')
+        for alias in settings.DATABASE_REPLICAS:
+            replica = connections.databases.get(alias)
+            if replica is None:
+                raise CommandError(f'База {alias} не описана в DATABASES.')
+            if replica['ENGINE'] != primary.settings_dict['ENGINE']:
+                raise CommandError(f'Реплика {alias} не является SQLite.')
+            connections[alias].close()
+            source = sqlite3.connect(primary.settings_dict['NAME'])
+            target = sqlite3.connect(replica['NAME'])
+            try:
+                # Backup API даёт согласованную копию работающей базы.
+                source.backup(target)
+            finally:
+                source.close()
+                target.close()
+            self.stdout.write(f'{alias}: скопировано.')
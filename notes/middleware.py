@@ -0,0 +1,302 @@
+import json
+import math
+import threading
+import time
+from http import HTTPStatus
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.http import HttpResponse
+from django.urls import reverse
+
+from .routers import pin_primary
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+# Ключ окружения WSGI и scope ASGI, которым notes/warmup.py помечает
+# синтетические запросы. Заголовки попадают в них только с префиксом
+# HTTP_ или в список headers, поэтому клиент не может его подделать.
+WARMUP_KEY = 'notes.warmup'
+
+
+# Секреты, которые не должны попадать в трассу: параметры маршрутов
+# (токен публичной ссылки даёт доступ к заметке) и GET-параметры
+# (поисковые строки). Их значения заменяются на TRACE_REDACTED.
+TRACE_SECRET_KWARGS = {'notes:shared': ('token',)}
+TRACE_SECRET_PARAMS = ('q',)
+TRACE_REDACTED = 'redacted'
+
+
+def is_warmup(request):
+    """Запрос создан прогревом, а не пришёл от клиента."""
+    scope = getattr(request, 'scope', {})
+    return bool(request.META.get(WARMUP_KEY) or scope.get(WARMUP_KEY))
+
+
+class ReplicaStickinessMiddleware:
+    """Обеспечивает чтение собственных записей при работе с репликами.
+
+    Изменяющие запросы и запросы в течение NOTES_REPLICA_STICKY_SECONDS
+    после них читают данные из основной базы. Отметка хранится в cookie,
+    чтобы не обращаться за ней к сессии в базе данных.
+    """
+
+    cookie_name = 'db_primary_until'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        writing = request.method not in SAFE_METHODS
+        with pin_primary(writing or self.is_sticky(request)):
+            response = self.get_response(request)
+        if writing:
+            sticky_seconds = settings.NOTES_REPLICA_STICKY_SECONDS
+            response.set_cookie(
+                self.cookie_name,
+                str(int(time.time() + sticky_seconds)),
+                max_age=sticky_seconds,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+    def is_sticky(self, request):
+        try:
+            until = int(request.COOKIES.get(self.cookie_name, 0))
+        except ValueError:
+            return False
+        return until > time.time()
+
+
+RATE_PERIODS = {
+    **dict.fromkeys(('s', 'sec', 'second'), 1),
+    **dict.fromkeys(('m', 'min', 'minute'), 60),
+    **dict.fromkeys(('h', 'hour'), 60 * 60),
+    **dict.fromkeys(('d', 'day'), 24 * 60 * 60),
+}
+
+
+def parse_rate(rate):
+    """Разбирает лимит вида '10/m' в пару (ёмкость, токенов в секунду).
+
+    Для неизвестного периода (например, '5/month') выбрасывает
+    ImproperlyConfigured, а не подбирает похожий.
+    """
+    count, _, period = rate.partition('/')
+    period = period.lower()
+    if period in ('seconds', 'minutes', 'hours', 'days'):
+        period = period[:-1]
+    seconds = RATE_PERIODS.get(period)
+    if seconds is None or not count.isdigit():
+        raise ImproperlyConfigured(f'Некорректный лимит {rate!r}.')
+    return int(count), int(count) / seconds
+
+
+def take_token(key, rate):
+    """Забирает токен из корзины key; возвращает 0 или секунды до токена.
+
+    Состояние корзины хранится в кеше NOTES_RATE_LIMIT_CACHE. Чтение и
+    запись не атомарны, поэтому при гонке параллельные запросы могут
+    немного превысить лимит; для защиты от перегрузки этого достаточно.
+    """
+    capacity, refill = parse_rate(rate)
+    bucket_cache = caches[settings.NOTES_RATE_LIMIT_CACHE]
+    now = time.time()
+    tokens, updated = bucket_cache.get(key, (capacity, now))
+    tokens = min(capacity, tokens + (now - updated) * refill)
+    if tokens < 1:
+        return (1 - tokens) / refill
+    bucket_cache.set(key, (tokens - 1, now), int(capacity / refill) + 1)
+    return 0
+
+
+def client_ip(request):
+    """IP клиента с учётом NOTES_RATE_LIMIT_TRUSTED_PROXIES.
+
+    Каждый прокси дописывает в X-Forwarded-For адрес, с которого к нему
+    пришёл запрос, поэтому адрес клиента записал самый внешний из N
+    доверенных прокси: N-й справа. Левые значения присылает клиент, им
+    верить нельзя.
+    """
+    proxies = settings.NOTES_RATE_LIMIT_TRUSTED_PROXIES
+    forwarded = [
+        address.strip()
+        for address in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')
+        if address.strip()
+    ]
+    if proxies and len(forwarded) >= proxies:
+        return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def retry_response(status, retry_after):
+    response = HttpResponse(
+        'Слишком много запросов, повторите позже.',
+        status=status,
+        content_type='text/plain; charset=utf-8',
+    )
+    response['Retry-After'] = str(math.ceil(retry_after))
+    return response
+
+
+class RateLimitMiddleware:
+    """Ограничивает частоту изменяющих запросов к отдельным страницам.
+
+    Лимиты задаются в NOTES_RATE_LIMITS по имени URL отдельно для
+    пользователя и для IP, например {'notes:add': {'user': '30/m'}}.
+    Корзина ёмкостью N пополняется на N токенов за период. При исчерпании
+    возвращается 429 с заголовком Retry-After. Анонимные пользователи
+    ограничиваются только по IP. Безопасные запросы (GET, HEAD и т. п.)
+    не ограничиваются, даже если их маршрут есть в NOTES_RATE_LIMITS.
+    Middleware должен стоять после AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # Ошибка в лимитах видна при запуске, а не на первом запросе.
+        for limits in settings.NOTES_RATE_LIMITS.values():
+            for rate in limits.values():
+                parse_rate(rate)
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in SAFE_METHODS:
+            return None
+        url_name = request.resolver_match.view_name
+        limits = settings.NOTES_RATE_LIMITS.get(url_name)
+        if not limits:
+            return None
+        keys = {'ip': client_ip(request)}
+        if request.user.is_authenticated:
+            keys['user'] = request.user.pk
+        for scope, rate in limits.items():
+            if scope not in keys:
+                continue
+            retry_after = take_token(
+                f'notes:ratelimit:{url_name}:{scope}:{keys[scope]}', rate
+            )
+            if retry_after:
+                return retry_response(HTTPStatus.TOO_MANY_REQUESTS,
+                                      retry_after)
+        return None
+
+
+class LoadSheddingMiddleware:
+    """Отклоняет запросы с 503, когда процесс перегружен.
+
+    Запрос отклоняется, если процесс уже обрабатывает
+    NOTES_SHED_MAX_IN_FLIGHT запросов или если запрос ждал в очереди
+    фронтенд-сервера дольше NOTES_SHED_MAX_QUEUE_SECONDS. Время постановки
+    в очередь берётся из заголовка X-Request-Start (nginx:
+    proxy_set_header X-Request-Start "t=${msec}";). Быстрый отказ лишним
+    запросам не даёт расти времени ответа остальных. Middleware должен
+    стоять сразу после TraceRecordingMiddleware, чтобы отказы попадали
+    в трассу.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        max_in_flight = settings.NOTES_SHED_MAX_IN_FLIGHT
+        with self.lock:
+            overloaded = (
+                max_in_flight is not None and self.in_flight >= max_in_flight
+            )
+            if not overloaded:
+                self.in_flight += 1
+        if overloaded or self.queued_too_long(request):
+            if not overloaded:
+                self.release()
+            return retry_response(HTTPStatus.SERVICE_UNAVAILABLE,
+                                  settings.NOTES_SHED_RETRY_AFTER)
+        try:
+            return self.get_response(request)
+        finally:
+            self.release()
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def queued_too_long(self, request):
+        max_queue_seconds = settings.NOTES_SHED_MAX_QUEUE_SECONDS
+        header = request.META.get('HTTP_X_REQUEST_START')
+        if max_queue_seconds is None or not header:
+            return False
+        if header.startswith('t='):
+            header = header[2:]
+        try:
+            started = float(header)
+        except ValueError:
+            return False
+        # Разные серверы пишут секунды, миллисекунды или микросекунды.
+        while started > 1e11:
+            started /= 1000
+        return time.time() - started > max_queue_seconds
+
+
+def trace_path(request):
+    """Адрес запроса с заменёнными секретами для записи в трассу."""
+    path = request.path
+    match = request.resolver_match
+    if match and match.view_name in TRACE_SECRET_KWARGS:
+        path = reverse(match.view_name, kwargs={
+            **match.kwargs,
+            **dict.fromkeys(
+                TRACE_SECRET_KWARGS[match.view_name], TRACE_REDACTED
+            ),
+        })
+    query = request.GET.copy()
+    for name in TRACE_SECRET_PARAMS:
+        if name in query:
+            query.setlist(
+                name, [TRACE_REDACTED] * len(query.getlist(name))
+            )
+    return f'{path}?{query.urlencode()}' if query else path
+
+
+class TraceRecordingMiddleware:
+    """Записывает запросы в NOTES_TRACE_FILE для нагрузочного теста.
+
+    Каждая строка файла — JSON с временем, именем URL, методом, адресом,
+    id пользователя, кодом и длительностью ответа. Тела запросов и
+    запросы прогрева не записываются, секреты в адресе заменяются
+    (см. TRACE_SECRET_KWARGS). Без NOTES_TRACE_FILE middleware
+    отключается. Должен стоять первым, чтобы учитывать время всех
+    остальных middleware.
+    """
+
+    def __init__(self, get_response):
+        if not settings.NOTES_TRACE_FILE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.path = settings.NOTES_TRACE_FILE
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        started = time.time()
+        timer = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - timer
+        if is_warmup(request):
+            return response
+        user = getattr(request, 'user', None)
+        match = request.resolver_match
+        line = json.dumps({
+            'time': started,
+            'route': match.view_name if match else None,
+            'method': request.method,
+            'path': trace_path(request),
+            'user': user.pk if user and user.is_authenticated else None,
+            'status': response.status_code,
+            'duration': round(duration, 6),
+        })
+        with self.lock, open(self.path, 'a', encoding='utf-8') as trace:
+            trace.write(line + '\n')
+        return response
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.15 on 2026-10-19 09:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('notes', '0003_soft_delete'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='note_stats', serialize=False, to='auth.user', verbose_name='Пользователь')),
+                ('note_count', models.IntegerField(default=0, verbose_name='Заметок')),
+                ('text_length', models.BigIntegerField(default=0, verbose_name='Символов в текстах')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-19 09:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0005_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='note',
+            name='share_token',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True, unique=True, verbose_name='Токен публичной ссылки'),
+        ),
+    ]
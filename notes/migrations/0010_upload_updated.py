@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-19 10:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notes', '0009_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachmentupload',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, verbose_name='Последняя часть'),
+        ),
+    ]
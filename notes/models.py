@@ -1,8 +1,141 @@
+import uuid
+from functools import lru_cache, partial
+
 from django.conf import settings
-from django.db import models
+from django.db import models, router, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Length
+from django.urls import get_script_prefix, reverse
+from django.utils import timezone
 
 from pytils.translit import slugify
 
+from . import sharding, sharing
+from .attachments import blob_path, upload_path
+
+
+class ShardedQuerySet(models.QuerySet):
+
+    def create(self, **kwargs):
+        """Без явного using объект создаётся в шарде автора."""
+        if self._db is not None:
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
+class Tag(models.Model):
+    """Тег заметок пользователя.
+
+    note_count хранит число неудалённых заметок с тегом и обновляется
+    при изменении связей, поэтому облако тегов не требует агрегации.
+    """
+
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='note_tags',
+        verbose_name='Автор',
+        # Теги лежат в шарде автора, а пользователи — в default.
+        db_constraint=False,
+    )
+    name = models.CharField('Название', max_length=50)
+    note_count = models.IntegerField('Заметок', default=0)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('name',)
+        constraints = (
+            models.UniqueConstraint(
+                fields=('author', 'name'), name='unique_author_tag'
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=('author', '-note_count'), name='tag_cloud_idx'
+            ),
+        )
+
+    def __str__(self):
+        return self.name
+
+
+class NoteQuerySet(ShardedQuerySet):
+
+    def for_author(self, author, primary=False):
+        """Заметки автора из его шарда."""
+        author_id = getattr(author, 'pk', author)
+        return sharding.for_author(
+            self.filter(author_id=author_id), author_id, primary
+        )
+
+    def soft_delete(self):
+        """Помечает заметки удалёнными одним UPDATE-запросом."""
+        return self._set_deleted(True)
+
+    def restore(self):
+        """Восстанавливает удалённые заметки одним UPDATE-запросом."""
+        return self._set_deleted(False)
+
+    def _set_deleted(self, is_deleted):
+        """Меняет пометку удаления, обновляя счётчики пользователя и тегов."""
+        using = self._db or router.db_for_write(self.model)
+        sign = -1 if is_deleted else 1
+        with transaction.atomic(using=using):
+            changed = self.using(using).filter(is_deleted=not is_deleted)
+            totals = changed.stats_by_author()
+            tag_totals = Note.tags.through.objects.using(using).filter(
+                note__in=changed
+            ).order_by().values('tag_id').annotate(notes=Count('note_id'))
+            tag_totals = [(row['tag_id'], row['notes']) for row in tag_totals]
+            tokens = list(changed.exclude(share_token=None).values_list(
+                'share_token', flat=True
+            ))
+            updated = changed.update(is_deleted=is_deleted)
+            transaction.on_commit(
+                partial(sharing.purge, *tokens), using=using
+            )
+            for author_id, (notes, length) in totals.items():
+                UserStats.change_with_notes(
+                    using, author_id, sign * notes, sign * length
+                )
+            for tag_id, notes in tag_totals:
+                Tag.objects.using(using).filter(pk=tag_id).update(
+                    note_count=F('note_count') + sign * notes
+                )
+        return updated
+
+    def stats_by_author(self):
+        """Фактические счётчики по авторам: {author_id: (заметки, длина)}."""
+        return {
+            row['author_id']: (row['notes'], row['length'] or 0)
+            for row in self.order_by().values('author_id').annotate(
+                notes=Count('pk'), length=Sum(Length('text'))
+            )
+        }
+
+
+class NoteManager(models.Manager.from_queryset(NoteQuerySet)):
+    """Менеджер, скрывающий удалённые заметки."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
+SLUG_PLACEHOLDER = '__slug__'
+
+
+@lru_cache(maxsize=None)
+def detail_url_template(script_prefix):
+    """Адрес страницы заметки с заглушкой вместо slug.
+
+    Вычисляется один раз для каждого префикса приложения, поэтому
+    список заметок не вызывает reverse() для каждой строки.
+    """
+    return reverse('notes:detail', args=(SLUG_PLACEHOLDER,))
+
 
 class Note(models.Model):
     title = models.CharField(
@@ -26,13 +159,405 @@ class Note(models.Model):
     author = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
+        # Заметки лежат в шарде автора, а пользователи — в default.
+        db_constraint=False,
     )
+    tags = models.ManyToManyField(
+        Tag,
+        blank=True,
+        related_name='notes',
+        verbose_name='Теги',
+    )
+    share_token = models.CharField(
+        'Токен публичной ссылки',
+        max_length=32,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    is_deleted = models.BooleanField(
+        'Удалена',
+        default=False,
+        db_index=True,
+    )
+
+    objects = NoteManager()
+    all_objects = NoteQuerySet.as_manager()
 
     def __str__(self):
         return self.title
 
+    def get_absolute_url(self):
+        # slug содержит только безопасные для URL символы.
+        return detail_url_template(get_script_prefix()).replace(
+            SLUG_PLACEHOLDER, self.slug
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Длина текста нужна save(), чтобы обновить счётчики без запроса.
+        text = instance.__dict__.get('text')
+        instance._stored_text_length = None if text is None else len(text)
+        # По ним save() решает, нужно ли перестраивать индексы поиска.
+        instance._stored_title = instance.__dict__.get('title')
+        instance._stored_text = text
+        return instance
+
     def save(self, *args, **kwargs):
         if not self.slug:
             max_slug_length = self._meta.get_field('slug').max_length
             self.slug = slugify(self.title)[:max_slug_length]
-        super().save(*args, **kwargs)
+        adding = self._state.adding
+        stored_length = getattr(self, '_stored_text_length', None)
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self
+        )
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+            if not self.is_deleted and (adding or stored_length is not None):
+                length_delta = len(self.text) - (stored_length or 0)
+                # Место под заметку могло быть занято UserStats.reserve.
+                notes = int(adding and not getattr(self, '_reserved', False))
+                if notes or length_delta:
+                    UserStats.change_with_notes(
+                        using, self.author_id, notes, length_delta
+                    )
+            title_changed = self.title != getattr(self, '_stored_title', None)
+            text_changed = self.text != getattr(self, '_stored_text', None)
+            if title_changed or text_changed:
+                # MinHash длинного текста считается долго: индексы
+                # перестраиваются в фоне, а не под блокировкой записи.
+                from .tasks import index_note
+                index_note.enqueue(
+                    key=(f'index-note:{using}:{self.pk}:'
+                         f'{title_changed:d}{text_changed:d}'),
+                    note_id=self.pk,
+                    alias=using,
+                    title=title_changed,
+                    text=text_changed,
+                    using=using,
+                )
+            if self.share_token:
+                transaction.on_commit(
+                    partial(sharing.purge, self.share_token), using=using
+                )
+        self._stored_text_length = len(self.text)
+        self._stored_title, self._stored_text = self.title, self.text
+
+    def delete(self, using=None, keep_parents=False):
+        """Удаляет заметку, обновляя счётчики, если она не была удалена.
+
+        QuerySet.delete() счётчики не меняет: так purge_notes удаляет уже
+        помеченные заметки и данные перенесённых и удалённых аккаунтов.
+        """
+        using = using or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            if not self.is_deleted:
+                Note.all_objects.using(using).filter(pk=self.pk).soft_delete()
+            return super().delete(using=using, keep_parents=keep_parents)
+
+    def share(self):
+        """Включает публичную ссылку на заметку."""
+        if not self.share_token:
+            self.share_token = sharing.new_token()
+            self.save(update_fields=('share_token',))
+
+    def revoke_share(self):
+        """Отзывает публичную ссылку и удаляет её страницу из кеша."""
+        token, self.share_token = self.share_token, None
+        self.save(update_fields=('share_token',))
+        transaction.on_commit(partial(sharing.purge, token))
+
+    def set_tags(self, names):
+        """Заменяет теги заметки, создавая недостающие."""
+        own_tags = Tag.objects.using(self._state.db).filter(
+            author_id=self.author_id
+        )
+        tags = list(own_tags.filter(name__in=names))
+        missing = set(names) - {tag.name for tag in tags}
+        if missing:
+            own_tags.bulk_create(
+                (Tag(author_id=self.author_id, name=name) for name in missing),
+                ignore_conflicts=True,
+            )
+            tags = own_tags.filter(name__in=names)
+        self.tags.set(tags)
+
+
+class Attachment(models.Model):
+    """Файл, прикреплённый к заметке."""
+
+    note = models.ForeignKey(
+        Note,
+        on_delete=models.CASCADE,
+        related_name='attachments',
+        verbose_name='Заметка',
+    )
+    name = models.CharField('Имя файла', max_length=255)
+    sha256 = models.CharField('SHA-256', max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField('Размер')
+    content_type = models.CharField(
+        'Тип содержимого', max_length=100, blank=True
+    )
+    created = models.DateTimeField('Добавлено', auto_now_add=True)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('id',)
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def path(self):
+        return blob_path(self.sha256)
+
+
+class TitleTrigram(models.Model):
+    """Триграмма заголовка заметки для нечёткого поиска."""
+
+    note = models.ForeignKey(
+        Note, on_delete=models.CASCADE, related_name='title_trigrams'
+    )
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_constraint=False,
+    )
+    trigram = models.CharField(max_length=3)
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=('author', 'trigram'), name='title_trigram_idx'
+            ),
+        )
+
+
+class TextBand(models.Model):
+    """Хеш полосы сигнатуры MinHash текста заметки."""
+
+    note = models.ForeignKey(
+        Note, on_delete=models.CASCADE, related_name='text_bands'
+    )
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_constraint=False,
+    )
+    band = models.PositiveSmallIntegerField()
+    bucket = models.BigIntegerField()
+
+    objects = ShardedQuerySet.as_manager()
+
+    class Meta:
+        indexes = (
+            models.Index(
+                fields=('author', 'band', 'bucket'), name='text_band_idx'
+            ),
+        )
+
+
+class AttachmentUpload(models.Model):
+    """Незавершённая загрузка вложения по частям."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    note = models.ForeignKey(
+        Note,
+        on_delete=models.CASCADE,
+        related_name='uploads',
+        verbose_name='Заметка',
+    )
+    name = models.CharField('Имя файла', max_length=255)
+    size = models.PositiveBigIntegerField('Ожидаемый размер')
+    offset = models.PositiveBigIntegerField('Получено байт', default=0)
+    created = models.DateTimeField('Начата', auto_now_add=True)
+    updated = models.DateTimeField('Последняя часть', auto_now=True)
+
+    objects = ShardedQuerySet.as_manager()
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def path(self):
+        return upload_path(self.id)
+
+    def stored_offset(self):
+        """Сколько байт действительно сохранено во временном файле.
+
+        Файл может оказаться короче offset, если он был потерян или
+        запись не дошла до диска: дописывать к нему нельзя.
+        """
+        try:
+            return min(self.offset, self.path.stat().st_size)
+        except FileNotFoundError:
+            return 0
+
+
+class AccountDeletion(models.Model):
+    """Запрос на фоновое удаление пользователя вместе с заметками."""
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Пользователь',
+    )
+    requested = models.DateTimeField('Запрошено', auto_now_add=True)
+
+    def __str__(self):
+        return str(self.user)
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики заметок пользователя.
+
+    Изменяются атомарными UPDATE с F()-выражениями при создании,
+    изменении и удалении заметок. Расхождения исправляет команда
+    reconcile_note_stats.
+    """
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='note_stats',
+        verbose_name='Пользователь',
+    )
+    note_count = models.IntegerField('Заметок', default=0)
+    text_length = models.BigIntegerField('Символов в текстах', default=0)
+
+    def __str__(self):
+        return str(self.user_id)
+
+    @classmethod
+    def for_user(cls, user_id, using=None):
+        """Счётчики пользователя; при первом обращении они вычисляются."""
+        stats = cls.objects.using(using).filter(user_id=user_id).first()
+        return stats or cls.reconcile(user_id, using=using)
+
+    @classmethod
+    def change(cls, user_id, notes=0, length=0, using=None):
+        """Атомарно изменяет счётчики пользователя на заданные величины."""
+        using = using or router.db_for_write(cls)
+        updated = cls.objects.using(using).filter(user_id=user_id).update(
+            note_count=F('note_count') + notes,
+            text_length=F('text_length') + length,
+        )
+        if not updated:
+            # Записи ещё нет: изменение уже в базе, достаточно пересчёта.
+            cls.reconcile(user_id, using=using)
+
+    @classmethod
+    def reserve(cls, user_id, limit):
+        """Занимает место под новую заметку, если лимит не исчерпан.
+
+        Проверка и увеличение счётчика выполняются одним UPDATE, поэтому
+        параллельные запросы не превысят лимит. Заметку затем сохраняют
+        с _reserved = True в той же транзакции основной базы.
+        """
+        using = router.db_for_write(cls)
+        cls.for_user(user_id, using=using)
+        return bool(cls.objects.using(using).filter(
+            user_id=user_id, note_count__lt=limit
+        ).update(note_count=F('note_count') + 1))
+
+    @classmethod
+    def change_with_notes(cls, notes_db, user_id, notes=0, length=0):
+        """Изменяет счётчики вместе с транзакцией заметок в базе notes_db.
+
+        Если заметки лежат в другом шарде, счётчики меняются после
+        фиксации его транзакции: откат заметки их не затронет, а сбой
+        между фиксациями исправит reconcile_note_stats.
+        """
+        if notes_db == router.db_for_write(cls):
+            cls.change(user_id, notes, length)
+        else:
+            transaction.on_commit(
+                partial(cls.change, user_id, notes, length), using=notes_db
+            )
+
+    @classmethod
+    def reconcile(cls, user_id, using=None):
+        """Пересчитывает счётчики пользователя по его заметкам."""
+        using = using or router.db_for_write(cls)
+        with transaction.atomic(using=using):
+            # Строка блокируется до подсчёта: изменения от заметок,
+            # созданных во время подсчёта, применятся после пересчёта,
+            # а не будут им перезаписаны.
+            stats, _ = cls.objects.using(using).select_for_update(
+            ).get_or_create(user_id=user_id)
+            stats.note_count, stats.text_length = Note.objects.for_author(
+                user_id, primary=True
+            ).stats_by_author().get(user_id, (0, 0))
+            stats.save(update_fields=('note_count', 'text_length'))
+        return stats
+
+
+class ShardAssignment(models.Model):
+    """Запись справочника: в каком шарде хранятся данные пользователя."""
+
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+        verbose_name='Пользователь',
+    )
+    shard = models.CharField('Шард', max_length=50)
+    moving = models.BooleanField('Идёт перенос', default=False)
+
+    def __str__(self):
+        return f'{self.user_id}: {self.shard}'
+
+
+class Task(models.Model):
+    """Фоновая задача в очереди (см. notes.jobs)."""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Ожидает'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField('Задача', max_length=100)
+    kwargs = models.JSONField('Аргументы', default=dict)
+    idempotency_key = models.CharField(
+        'Ключ идемпотентности', max_length=200, null=True, blank=True
+    )
+    status = models.CharField(
+        'Статус', max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    attempts = models.PositiveIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveIntegerField('Максимум попыток', default=5)
+    run_at = models.DateTimeField('Выполнить после', default=timezone.now)
+    locked_at = models.DateTimeField('Взята в работу', null=True, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+    created = models.DateTimeField('Создана', auto_now_add=True)
+
+    class Meta:
+        indexes = (
+            models.Index(fields=('status', 'run_at'), name='task_queue_idx'),
+        )
+        constraints = (
+            # Одинаковая работа, ещё не начатая, ставится в очередь один раз.
+            models.UniqueConstraint(
+                fields=('idempotency_key',),
+                condition=Q(status='pending'),
+                name='unique_pending_task_key',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.name} #{self.pk}'
@@ -0,0 +1,104 @@
+"""Фоновое удаление заметок небольшими порциями.
+
+Каждая порция удаляется в собственной короткой транзакции, а между
+порциями делается пауза, чтобы записи других пользователей не ждали
+освобождения блокировки базы данных.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from . import sharding
+from .models import AccountDeletion, AttachmentUpload, Note
+
+BATCH_SIZE = 500
+PAUSE = 0.1
+
+
+class AccountNotPurged(Exception):
+    """Пользователя удаляют, не удалив заранее его заметки."""
+
+
+def schedule_account_deletion(user):
+    """Отключает пользователя и ставит его удаление в очередь."""
+    user.is_active = False
+    user.save(update_fields=('is_active',))
+    AccountDeletion.objects.get_or_create(user=user)
+
+
+def purge_batch(queryset, batch_size=BATCH_SIZE):
+    """Удаляет одну порцию заметок; возвращает их количество."""
+    ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+    if ids:
+        with transaction.atomic(using=queryset.db):
+            Note.all_objects.using(queryset.db).filter(pk__in=ids).delete()
+    return len(ids)
+
+
+def purge_notes(queryset, batch_size=BATCH_SIZE, pause=PAUSE):
+    """Удаляет все заметки из queryset порциями с паузами."""
+    total = 0
+    while True:
+        deleted = purge_batch(queryset, batch_size)
+        total += deleted
+        if deleted < batch_size:
+            return total
+        time.sleep(pause)
+
+
+def purge_uploads(batch_size=BATCH_SIZE):
+    """Удаляет брошенные загрузки вместе с их временными файлами.
+
+    Загрузка считается брошенной, если в неё ничего не дописывали
+    NOTES_UPLOAD_EXPIRY секунд. Возвращает число удалённых загрузок.
+    """
+    deadline = timezone.now() - timedelta(
+        seconds=settings.NOTES_UPLOAD_EXPIRY
+    )
+    total = 0
+    for alias in sharding.shards():
+        expired = AttachmentUpload.objects.using(alias).filter(
+            updated__lt=deadline
+        )
+        while True:
+            batch = list(expired[:batch_size])
+            for upload in batch:
+                # Сигнал post_delete удаляет временный файл.
+                upload.delete()
+            total += len(batch)
+            if len(batch) < batch_size:
+                break
+    return total
+
+
+def purge(batch_size=BATCH_SIZE, pause=PAUSE):
+    """Удаляет помеченные заметки и пользователей из очереди удаления.
+
+    Заодно удаляет брошенные загрузки вложений. Возвращает пару
+    (число заметок, число пользователей).
+    """
+    purge_uploads(batch_size)
+    notes = sum(
+        purge_notes(
+            Note.all_objects.using(alias).filter(is_deleted=True),
+            batch_size,
+            pause,
+        )
+        for alias in sharding.shards()
+    )
+    users = 0
+    for deletion in AccountDeletion.objects.order_by('requested'):
+        notes += sharding.delete_user_data(
+            deletion.user_id,
+            sharding.shard_for(deletion.user_id),
+            batch_size,
+            pause,
+        )
+        # Заметок не осталось, поэтому каскадное удаление будет коротким.
+        get_user_model().objects.filter(pk=deletion.user_id).delete()
+        users += 1
+    return notes, users
@@ -1,12 +1,22 @@
 # conftest.py
 import pytest
 
+from django.conf import settings
+from django.core.cache import cache
+
 # Импортируем класс клиента.
 from django.test.client import Client
 
 # Импортируем модель заметки, чтобы создать экземпляр.
 from notes.models import Note
 
+# Второй шард для тестов переноса заметок между базами. Добавляем его
+# до того, как pytest-django создаст тестовые базы.
+settings.DATABASES['shard'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': settings.BASE_DIR / 'db.shard.sqlite3',
+}
+
 
 @pytest.fixture
 # Используем встроенную фикстуру для модели пользователей django_user_model.
@@ -45,6 +55,18 @@ def note(author):
     return note
 
 
+@pytest.fixture
+def create_notes():
+    # Создаём заметки одним запросом, без счётчиков и индексов.
+    def create(author, count):
+        return Note.objects.bulk_create(
+            Note(title=f'Заметка {i}', text='Текст', slug=f'slug-{i}',
+                 author=author)
+            for i in range(count)
+        )
+    return create
+
+
 @pytest.fixture
 def slug_for_args(note):
     return (note.slug,)
@@ -57,3 +79,16 @@ def form_data():
         'text': 'Новый текст',
         'slug': 'new-slug',
     }
+
+
+@pytest.fixture(autouse=True)
+def attachments_root(settings, tmp_path):
+    # Вложения пишем во временную директорию, а не в media проекта.
+    settings.NOTES_ATTACHMENTS_ROOT = tmp_path / 'attachments'
+    return settings.NOTES_ATTACHMENTS_ROOT
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Кеш общий для всех тестов: сбрасываем корзины лимитов и прочее.
+    cache.clear()
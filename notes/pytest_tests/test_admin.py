@@ -0,0 +1,89 @@
+"""Тесты админки заметок."""
+from django.urls import reverse
+
+from notes.models import Note, Tag, UserStats
+
+CHANGELIST = reverse('admin:notes_note_changelist')
+
+
+def test_changelist_count_is_capped(
+    settings, admin_client, author, create_notes
+):
+    """Число строк считается не дальше предела."""
+    settings.NOTES_ADMIN_COUNT_LIMIT = 3
+    create_notes(author, 5)
+    response = admin_client.get(CHANGELIST)
+    assert response.context['cl'].result_count == 3
+
+
+def test_changelist_queries_do_not_grow(
+    admin_client, author, create_notes, django_assert_max_num_queries
+):
+    """Авторы загружаются вместе с заметками, а не по одному."""
+    create_notes(author, 30)
+    # Сессия, пользователь, подсчёт, страница и кнопка фильтра удалённых.
+    with django_assert_max_num_queries(6):
+        response = admin_client.get(CHANGELIST)
+    assert author.username in response.content.decode()
+
+
+def test_add_form_uses_raw_id_author(admin_client):
+    """Поле автора не загружает список всех пользователей."""
+    response = admin_client.get(reverse('admin:notes_note_add'))
+    assert 'vForeignKeyRawIdAdminField' in response.content.decode()
+
+
+def test_change_form_keeps_counted_fields_readonly(admin_client, note):
+    """Автора и пометку удаления нельзя изменить в форме заметки."""
+    response = admin_client.get(
+        reverse('admin:notes_note_change', args=(note.pk,))
+    )
+    fields = response.context['adminform'].form.fields
+    assert 'author' not in fields
+    assert 'is_deleted' not in fields
+
+
+def test_search_by_indexed_fields(admin_client, author, not_author, note):
+    """Поиск находит заметки по slug, id и имени автора."""
+    other = Note.objects.create(title='Другая', text='Текст',
+                                author=not_author)
+    for term, expected in (
+        (note.slug, [note]),
+        (str(other.pk), [other]),
+        (not_author.username, [other]),
+        ('Заголов', []),
+    ):
+        response = admin_client.get(CHANGELIST, {'q': term})
+        assert list(response.context['cl'].result_list) == expected
+
+
+def test_soft_delete_and_purge_actions(admin_client, author, create_notes):
+    """Действия обрабатывают заметки порциями и обновляют счётчики."""
+    create_notes(author, 3)
+    UserStats.reconcile(author.pk)
+    selected = sorted(Note.objects.values_list('pk', flat=True))
+    response = admin_client.get(CHANGELIST)
+    actions = dict(response.context['action_form'].fields['action'].choices)
+    assert 'delete_selected' not in actions
+    admin_client.post(CHANGELIST, {
+        'action': 'soft_delete_selected', '_selected_action': selected,
+    })
+    assert not Note.objects.exists()
+    assert UserStats.for_user(author.pk).note_count == 0
+    admin_client.post(CHANGELIST, {
+        'action': 'purge_selected', '_selected_action': selected[:2],
+    })
+    assert list(Note.all_objects.values_list('pk', flat=True)) == selected[2:]
+
+
+def test_restore_action_updates_counters(admin_client, author, note):
+    """Восстановление возвращает заметку в счётчики пользователя и тегов."""
+    note.set_tags(['тег'])
+    Note.objects.filter(pk=note.pk).soft_delete()
+    assert UserStats.for_user(author.pk).note_count == 0
+    admin_client.post(CHANGELIST, {
+        'action': 'restore_selected', '_selected_action': [note.pk],
+    })
+    assert Note.objects.filter(pk=note.pk).exists()
+    assert UserStats.for_user(author.pk).note_count == 1
+    assert Tag.objects.get(name='тег').note_count == 1
@@ -0,0 +1,159 @@
+"""Тесты вложений заметок."""
+import os
+from http import HTTPStatus
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from notes import jobs
+from notes.attachments import blob_age
+from notes.models import Attachment, AttachmentUpload, Note, Task
+
+CONTENT = b'0123456789' * 10
+
+
+def start_upload(client, note, size=len(CONTENT)):
+    url = reverse('notes:upload_start', args=(note.slug,))
+    response = client.post(url, {'name': 'data.bin', 'size': size})
+    assert response.status_code == HTTPStatus.CREATED
+    return reverse('notes:upload_chunk', args=(response.json()['id'],))
+
+
+def put_chunk(client, url, start, end, total=len(CONTENT)):
+    return client.put(
+        url,
+        CONTENT[start:end + 1],
+        content_type='application/octet-stream',
+        HTTP_CONTENT_RANGE=f'bytes {start}-{end}/{total}',
+    )
+
+
+def test_chunked_upload_can_be_resumed(author_client, note):
+    """Загрузку по частям можно продолжить с принятого смещения."""
+    url = start_upload(author_client, note)
+    response = put_chunk(author_client, url, 0, 39)
+    assert response.json()['offset'] == 40
+    response = put_chunk(author_client, url, 0, 39)
+    assert response.status_code == HTTPStatus.CONFLICT
+    assert author_client.get(url).json()['offset'] == 40
+    response = put_chunk(author_client, url, 40, len(CONTENT) - 1)
+    assert response.status_code == HTTPStatus.CREATED
+    assert not AttachmentUpload.objects.exists()
+    attachment = Attachment.objects.get()
+    assert attachment.path.read_bytes() == CONTENT
+
+
+def test_identical_files_are_stored_once(author_client, note):
+    """Одинаковые файлы хранятся на диске один раз."""
+    url = reverse('notes:attach', args=(note.slug,))
+    for name in ('a.txt', 'b.txt'):
+        author_client.post(url, {'file': SimpleUploadedFile(name, CONTENT)})
+    first, second = Attachment.objects.all()
+    assert first.sha256 == second.sha256
+    assert first.path == second.path
+    first.delete()
+    assert second.path.exists()
+
+
+def test_range_download(author_client, note):
+    """Вложение можно скачать по частям."""
+    url = reverse('notes:attach', args=(note.slug,))
+    author_client.post(url, {'file': SimpleUploadedFile('a.txt', CONTENT)})
+    url = reverse('notes:attachment', args=(Attachment.objects.get().pk,))
+    response = author_client.get(url, HTTP_RANGE='bytes=10-19')
+    assert response.status_code == HTTPStatus.PARTIAL_CONTENT
+    assert response['Content-Range'] == f'bytes 10-19/{len(CONTENT)}'
+    assert b''.join(response.streaming_content) == CONTENT[10:20]
+    response = author_client.get(url, HTTP_RANGE='bytes=1000-')
+    assert response.status_code == HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+
+
+def test_other_user_cant_download(author_client, not_author_client, note):
+    """Чужие вложения недоступны."""
+    url = reverse('notes:attach', args=(note.slug,))
+    author_client.post(url, {'file': SimpleUploadedFile('a.txt', CONTENT)})
+    url = reverse('notes:attachment', args=(Attachment.objects.get().pk,))
+    assert not_author_client.get(url).status_code == HTTPStatus.NOT_FOUND
+
+
+def test_unused_blob_removed_after_grace(
+    author_client, note, settings, django_capture_on_commit_callbacks
+):
+    """Файл без ссылок удаляется только после периода ожидания."""
+    url = reverse('notes:attach', args=(note.slug,))
+    author_client.post(url, {'file': SimpleUploadedFile('a.txt', CONTENT)})
+    attachment = Attachment.objects.get()
+    with django_capture_on_commit_callbacks(execute=True):
+        attachment.delete()
+    with django_capture_on_commit_callbacks(execute=True):
+        assert jobs.drain() == 1
+    assert attachment.path.exists()
+    task = Task.objects.get(name='notes.release_blob')
+    assert task.run_at > timezone.now()
+    settings.NOTES_ATTACHMENTS_BLOB_GRACE = 0
+    Task.objects.update(run_at=timezone.now())
+    assert jobs.drain() == 1
+    assert not attachment.path.exists()
+
+
+def test_dedup_refreshes_blob_age(author_client, note):
+    """Повторная загрузка того же файла продлевает его жизнь."""
+    url = reverse('notes:attach', args=(note.slug,))
+    author_client.post(url, {'file': SimpleUploadedFile('a.txt', CONTENT)})
+    path = Attachment.objects.get().path
+    os.utime(path, (0, 0))
+    author_client.post(url, {'file': SimpleUploadedFile('b.txt', CONTENT)})
+    assert blob_age(Attachment.objects.last().sha256) < 60
+
+
+def test_missing_file_download(author_client, note):
+    """Вложение без файла на диске отдаёт 404, а не ошибку сервера."""
+    url = reverse('notes:attach', args=(note.slug,))
+    author_client.post(url, {'file': SimpleUploadedFile('a.txt', CONTENT)})
+    attachment = Attachment.objects.get()
+    attachment.path.unlink()
+    url = reverse('notes:attachment', args=(attachment.pk,))
+    assert author_client.get(url).status_code == HTTPStatus.NOT_FOUND
+
+
+def test_lost_part_file_restarts_upload(author_client, note):
+    """Потерянный временный файл не дополняется нулями."""
+    url = start_upload(author_client, note)
+    put_chunk(author_client, url, 0, 39)
+    AttachmentUpload.objects.get().path.unlink()
+    assert author_client.get(url).json()['offset'] == 0
+    response = put_chunk(author_client, url, 40, len(CONTENT) - 1)
+    assert response.status_code == HTTPStatus.CONFLICT
+    assert response.json()['offset'] == 0
+    put_chunk(author_client, url, 0, 39)
+    response = put_chunk(author_client, url, 40, len(CONTENT) - 1)
+    assert response.status_code == HTTPStatus.CREATED
+    assert Attachment.objects.get().path.read_bytes() == CONTENT
+
+
+def test_abandoned_uploads_expire(settings, author_client, note):
+    """purge_notes удаляет брошенные загрузки и их временные файлы."""
+    url = start_upload(author_client, note)
+    put_chunk(author_client, url, 0, 39)
+    upload = AttachmentUpload.objects.get()
+    call_command('purge_notes', pause=0, stdout=None)
+    assert AttachmentUpload.objects.exists()
+    settings.NOTES_UPLOAD_EXPIRY = 0
+    call_command('purge_notes', pause=0, stdout=None)
+    assert not AttachmentUpload.objects.exists()
+    assert not upload.path.exists()
+
+
+def test_deleted_note_attachments_unavailable(author_client, note):
+    """Вложения удалённой заметки нельзя скачать или дозагрузить."""
+    url = reverse('notes:attach', args=(note.slug,))
+    author_client.post(url, {'file': SimpleUploadedFile('a.txt', CONTENT)})
+    upload_url = start_upload(author_client, note)
+    Note.objects.filter(pk=note.pk).soft_delete()
+    url = reverse('notes:attachment', args=(Attachment.objects.get().pk,))
+    assert author_client.get(url).status_code == HTTPStatus.NOT_FOUND
+    assert author_client.get(upload_url).status_code == HTTPStatus.NOT_FOUND
+    response = put_chunk(author_client, upload_url, 0, len(CONTENT) - 1)
+    assert response.status_code == HTTPStatus.NOT_FOUND
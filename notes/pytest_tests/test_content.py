@@ -1,9 +1,14 @@
 """Тесты для проверки контента на страницах приложения notes."""
+from unittest import mock
+
 import pytest
 
+from django import urls
 from django.urls import reverse
 
+from notes import models
 from notes.forms import NoteForm
+from notes.models import Note
 
 
 @pytest.mark.parametrize(
@@ -36,3 +41,42 @@ def test_pages_contains_form(author_client, name, args):
     response = author_client.get(url)
     assert 'form' in response.context
     assert isinstance(response.context['form'], NoteForm)
+
+
+def test_note_absolute_url(note):
+    """Адрес заметки совпадает с результатом reverse()."""
+    assert note.get_absolute_url() == reverse(
+        'notes:detail', args=(note.slug,)
+    )
+
+
+def test_header_shows_current_note_count(author_client, author, note):
+    """Шапка берётся из кеша, но число заметок в ней актуально."""
+    url = reverse('notes:home')
+    assert 'заметок: 1' in author_client.get(url).content.decode()
+    Note.objects.create(title='Ещё', text='Текст', author=author)
+    content = author_client.get(url).content.decode()
+    assert 'заметок: 2' in content
+    assert author.username in content
+
+
+def test_list_rows_do_not_reverse_urls(author_client, author):
+    """Число вызовов {% url %} не зависит от числа заметок в списке."""
+    Note.objects.bulk_create(
+        Note(title=f'Заметка {i}', text='Текст', slug=f'slug-{i}',
+             author=author)
+        for i in range(20)
+    )
+    url = reverse('notes:list')
+    author_client.get(url)
+    # Тег {% url %} импортирует reverse из django.urls при каждом вызове,
+    # а notes.models связал его с собой при импорте.
+    with mock.patch.object(
+        urls, 'reverse', wraps=urls.reverse
+    ) as url_tag_reverse, mock.patch.object(
+        models, 'reverse', wraps=models.reverse
+    ) as model_reverse:
+        response = author_client.get(url)
+    assert len(response.context['object_list']) == 20
+    assert url_tag_reverse.call_count < 5
+    assert model_reverse.call_count == 0
@@ -0,0 +1,118 @@
+"""Тесты фоновых задач."""
+import threading
+from datetime import timedelta
+
+import pytest
+
+from django.core.management import call_command
+from django.db import OperationalError
+from django.urls import reverse
+from django.utils import timezone
+
+from notes import jobs
+from notes.models import Task
+
+pytestmark = pytest.mark.django_db
+
+calls = []
+
+
+@jobs.task('tests.record')
+def record(value):
+    calls.append(value)
+
+
+@jobs.task('tests.flaky', max_attempts=2)
+def flaky():
+    raise RuntimeError('Сбой')
+
+
+@pytest.fixture(autouse=True)
+def clear_calls():
+    calls.clear()
+
+
+def test_task_is_enqueued_after_commit(django_capture_on_commit_callbacks):
+    """Задача появляется в очереди только после фиксации транзакции."""
+    with django_capture_on_commit_callbacks(execute=True):
+        record.enqueue(value=1)
+        assert not Task.objects.exists()
+    call_command('run_workers', once=True)
+    assert calls == [1]
+    assert not Task.objects.exists()
+
+
+def test_idempotency_key(django_capture_on_commit_callbacks):
+    """Задача с тем же ключом не ставится повторно, пока ждёт выполнения."""
+    with django_capture_on_commit_callbacks(execute=True):
+        record.enqueue(key='same', value=1)
+        record.enqueue(key='same', value=2)
+    assert jobs.drain() == 1
+    assert calls == [1]
+
+
+def test_failed_task_is_retried_with_backoff(
+    django_capture_on_commit_callbacks
+):
+    """Упавшая задача откладывается, а после всех попыток помечается."""
+    with django_capture_on_commit_callbacks(execute=True):
+        flaky.enqueue()
+    assert jobs.drain() == 1
+    task = Task.objects.get()
+    assert task.status == Task.PENDING
+    assert task.run_at > task.created
+    assert 'RuntimeError' in task.last_error
+    Task.objects.update(run_at=task.created)
+    jobs.drain()
+    task.refresh_from_db()
+    assert (task.status, task.attempts) == (Task.FAILED, 2)
+
+
+def test_edit_of_shared_note_enqueues_page_render(
+    author_client, note, form_data, django_capture_on_commit_callbacks
+):
+    """Редактирование опубликованной заметки ставит задачу в очередь."""
+    note.share()
+    form_data['slug'] = note.slug
+    with django_capture_on_commit_callbacks(execute=True):
+        author_client.post(reverse('notes:edit', args=(note.slug,)), form_data)
+    assert Task.objects.filter(name='notes.warm_shared_page').count() == 1
+    assert jobs.drain() == 2
+    assert not Task.objects.exists()
+
+
+def test_stale_task_with_pending_twin_is_dropped():
+    """Зависшая задача удаляется, если такая же уже ждёт в очереди."""
+    long_ago = timezone.now() - timedelta(days=1)
+    stale = Task.objects.create(
+        name='tests.record', kwargs={'value': 1}, idempotency_key='k',
+        status=Task.RUNNING, locked_at=long_ago,
+    )
+    lone = Task.objects.create(
+        name='tests.record', kwargs={'value': 2}, idempotency_key='other',
+        status=Task.RUNNING, locked_at=long_ago,
+    )
+    pending = Task.objects.create(
+        name='tests.record', kwargs={'value': 3}, idempotency_key='k',
+    )
+    assert jobs.requeue_stale() == 1
+    assert not Task.objects.filter(pk=stale.pk).exists()
+    assert set(Task.objects.values_list('pk', 'status')) == {
+        (lone.pk, Task.PENDING), (pending.pk, Task.PENDING),
+    }
+
+
+def test_worker_survives_errors(monkeypatch):
+    """Ошибка в цикле воркера записывается в лог, а поток продолжает."""
+    stop = threading.Event()
+    attempts = []
+
+    def failing_claim():
+        attempts.append(1)
+        if len(attempts) == 2:
+            stop.set()
+        raise OperationalError('database is locked')
+
+    monkeypatch.setattr(jobs, 'claim', failing_claim)
+    jobs.work(stop, poll_interval=0)
+    assert len(attempts) == 2
@@ -0,0 +1,165 @@
+"""Тесты записи и воспроизведения трафика."""
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import parse_qs
+
+import pytest
+
+from django.core.management import call_command
+from django.test.client import Client
+from django.urls import reverse
+
+from notes import loadtest
+from notes.models import Note
+from notes.middleware import WARMUP_KEY
+
+
+class Handler(BaseHTTPRequestHandler):
+    cookies = []
+    bodies = []
+
+    def do_GET(self):  # noqa: N802
+        self.cookies.append(self.headers.get('Cookie'))
+        self.send_response(500 if self.path == '/fail/' else 200)
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def do_POST(self):  # noqa: N802
+        length = int(self.headers['Content-Length'])
+        self.bodies.append(parse_qs(self.rfile.read(length).decode()))
+        self.do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    Handler.cookies = []
+    Handler.bodies = []
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f'http://127.0.0.1:{httpd.server_port}'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def entry(time, route, path, user=None, method='GET'):
+    return {'time': time, 'route': route, 'method': method, 'path': path,
+            'user': user, 'status': 200, 'duration': 0.01}
+
+
+def test_middleware_records_trace(settings, tmp_path, author):
+    settings.NOTES_TRACE_FILE = tmp_path / 'trace.jsonl'
+    client = Client()
+    client.force_login(author)
+    client.get(reverse('notes:list'), {'q': 'заметка'})
+    Client().get(reverse('notes:home'))
+    # Заголовок не выдаёт запрос за прогрев, отметка в окружении — выдаёт.
+    Client().get(reverse('notes:home'), HTTP_X_WARMUP='1')
+    Client().get(reverse('notes:home'), **{WARMUP_KEY: True})
+    recorded = loadtest.read_trace(settings.NOTES_TRACE_FILE)
+    assert [
+        (item['route'], item['method'], item['user'], item['status'])
+        for item in recorded
+    ] == [
+        ('notes:list', 'GET', author.pk, 200),
+        ('notes:home', 'GET', None, 200),
+        ('notes:home', 'GET', None, 200),
+    ]
+    assert recorded[0]['path'] == '/notes/?q=redacted'
+
+
+def test_trace_hides_secrets(settings, tmp_path, author_client, note):
+    """Токены публичных ссылок и поисковые строки не попадают в трассу."""
+    settings.NOTES_TRACE_FILE = tmp_path / 'trace.jsonl'
+    note.share()
+    Client().get(reverse('notes:shared', args=(note.share_token,)))
+    author_client.get(reverse('notes:list'), {'q': 'секрет', 'tag': 'a'})
+    trace = settings.NOTES_TRACE_FILE.read_text(encoding='utf-8')
+    assert note.share_token not in trace
+    assert 'секрет' not in json.loads(trace.splitlines()[1])['path']
+    assert [item['path'] for item in loadtest.read_trace(
+        settings.NOTES_TRACE_FILE
+    )] == ['/s/redacted/', '/notes/?q=redacted&tag=a']
+
+
+def test_assign_cookies_keeps_users_apart():
+    entries = [entry(0, 'notes:list', '/', user) for user in (1, 2, 1, None)]
+    cookies = loadtest.assign_cookies(entries, ['a', 'b'])
+    assert cookies == ['b', 'a', 'b', None]
+    assert loadtest.assign_cookies(entries, ['a', 'b'], anonymous=1) == [
+        None
+    ] * 4
+
+
+def test_replay_compresses_time_and_reports(server):
+    entries = [
+        entry(100, 'notes:home', '/'),
+        entry(105, 'notes:list', '/notes/'),
+        entry(110, 'notes:list', '/fail/'),
+        entry(111, 'notes:add', '/add/', method='POST'),
+        entry(112, 'notes:edit', '/edit/a/', method='POST'),
+        entry(113, 'notes:shared', '/s/redacted/'),
+    ]
+    results, elapsed = asyncio.run(
+        loadtest.replay(entries, server, speed=100)
+    )
+    assert 0.1 <= elapsed < 2
+    summary = loadtest.report(results, elapsed)
+    assert list(summary) == ['notes:list', 'notes:home', 'notes:add']
+    assert loadtest.skipped(entries) == {
+        ('POST', 'notes:edit'): 1, ('GET', 'notes:shared'): 1,
+    }
+    [body] = Handler.bodies
+    assert body['slug'][0].startswith('load-')
+    assert f'csrftoken={body["csrfmiddlewaretoken"][0]}' in (
+        Handler.cookies[-1]
+    )
+    assert summary['notes:list']['requests'] == 2
+    assert summary['notes:list']['errors'] == 1
+    assert summary['notes:home']['p50'] <= summary['notes:home']['max']
+
+
+@pytest.mark.django_db
+def test_replay_command(server, tmp_path, author):
+    trace = tmp_path / 'trace.jsonl'
+    trace.write_text('\n'.join(
+        json.dumps(item) for item in (
+            entry(0, 'notes:home', '/', user=7),
+            entry(1, 'notes:list', '/notes/', user=7),
+            entry(2, 'notes:edit', '/edit/a/', user=7, method='POST'),
+        )
+    ))
+    out = StringIO()
+    call_command(
+        'replay_traffic', str(trace), base_url=server, speed=10,
+        user=[author.username], stdout=out,
+    )
+    output = out.getvalue()
+    assert 'Отправлено запросов: 2 из 3' in output
+    assert 'Не воспроизведены: POST notes:edit (1)' in output
+    assert 'notes:list' in output
+    assert 'Без запросов:' in output and 'notes:add' in output
+    assert all(cookie.startswith('sessionid=') for cookie in Handler.cookies)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_replayed_forms_pass_csrf(live_server, author):
+    """Сгенерированные формы принимаются настоящим сервером."""
+    client = Client()
+    client.force_login(author)
+    cookie = f'sessionid={client.cookies["sessionid"].value}'
+    entries = [
+        entry(0, 'notes:add', reverse('notes:add'), user=1, method='POST'),
+        entry(0, 'users:login', reverse('users:login'), method='POST'),
+    ]
+    results, _ = asyncio.run(loadtest.replay(
+        entries, live_server.url, cookies=[cookie]
+    ))
+    assert sorted(status for _, status, _ in results) == [200, 302]
+    assert Note.objects.filter(author=author).count() == 1
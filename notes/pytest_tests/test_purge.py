@@ -0,0 +1,80 @@
+"""Тесты пакетного и фонового удаления заметок."""
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import transaction
+from django.urls import reverse
+from pytest_django.asserts import assertRedirects
+
+from notes.models import AccountDeletion, Note, UserStats
+from notes.purge import AccountNotPurged
+
+
+def test_bulk_delete_is_single_query(
+    author_client, author, not_author, create_notes,
+    django_assert_max_num_queries,
+):
+    """Выбранные заметки удаляются одним запросом, чужие не трогаются."""
+    create_notes(author, 3)
+    other_note = Note.objects.create(
+        title='Чужая', text='Текст', slug='other', author=not_author
+    )
+    ids = list(Note.objects.filter(author=author).values_list('pk', flat=True))
+    url = reverse('notes:bulk_delete')
+    UserStats.reconcile(author.pk)
+    with django_assert_max_num_queries(10) as captured:
+        response = author_client.post(url, {'notes': ids + [other_note.pk]})
+    note_writes = [
+        query for query in captured.captured_queries
+        if query['sql'].startswith('UPDATE "notes_note"')
+    ]
+    assert len(note_writes) == 1
+    assertRedirects(response, reverse('notes:success'))
+    assert list(Note.objects.all()) == [other_note]
+    assert Note.all_objects.filter(is_deleted=True).count() == 3
+
+
+def test_purge_removes_soft_deleted_notes(author, note, create_notes):
+    """Команда purge_notes удаляет помеченные заметки порциями."""
+    create_notes(author, 5)
+    Note.objects.filter(author=author).soft_delete()
+    call_command('purge_notes', batch_size=2, pause=0)
+    assert not Note.all_objects.exists()
+
+
+def test_purge_deletes_scheduled_account(
+    author, not_author, note, create_notes
+):
+    """Аккаунт из очереди удаляется после всех своих заметок."""
+    create_notes(author, 5)
+    other_note = Note.objects.create(
+        title='Чужая', text='Текст', slug='other', author=not_author
+    )
+    call_command(
+        'purge_notes', batch_size=2, pause=0,
+        schedule_account=[author.username],
+    )
+    assert not get_user_model().objects.filter(pk=author.pk).exists()
+    assert not AccountDeletion.objects.exists()
+    assert list(Note.all_objects.all()) == [other_note]
+
+
+def test_admin_schedules_account_deletion(admin_client, author, note):
+    """Удаление пользователя в админке ставит его в очередь на удаление."""
+    url = reverse('admin:auth_user_delete', args=(author.pk,))
+    admin_client.post(url, {'post': 'yes'})
+    author.refresh_from_db()
+    assert not author.is_active
+    assert AccountDeletion.objects.filter(user=author).exists()
+    assert Note.all_objects.filter(pk=note.pk).exists()
+    call_command('purge_notes', pause=0)
+    assert not get_user_model().objects.filter(pk=author.pk).exists()
+
+
+def test_user_with_notes_is_not_cascaded(author, note):
+    """Прямое удаление пользователя с заметками запрещено."""
+    # Точка сохранения нужна, чтобы после ошибки продолжить работу с базой.
+    with pytest.raises(AccountNotPurged), transaction.atomic():
+        author.delete()
+    assert Note.all_objects.filter(pk=note.pk).exists()
@@ -0,0 +1,117 @@
+"""Тесты ограничения частоты запросов и сброса нагрузки."""
+import time
+from http import HTTPStatus
+
+import pytest
+
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.urls import reverse
+
+from notes.middleware import LoadSheddingMiddleware, client_ip, parse_rate
+from notes.models import Note
+
+
+@pytest.mark.parametrize(
+    'rate, expected',
+    (
+        ('10/s', (10, 10)), ('30/m', (30, 0.5)), ('36/hour', (36, 0.01)),
+        ('48/days', (48, 48 / 86400)),
+    ),
+)
+def test_parse_rate(rate, expected):
+    """Лимит разбирается в ёмкость корзины и скорость её пополнения."""
+    assert parse_rate(rate) == expected
+
+
+@pytest.mark.parametrize('rate', ('5/month', '5/ms', '5', 'x/m'))
+def test_parse_rate_rejects_unknown_period(rate):
+    """Неизвестный период — ошибка настройки, а не лимит в минуту."""
+    with pytest.raises(ImproperlyConfigured):
+        parse_rate(rate)
+
+
+def test_add_limited_per_user(
+        settings, author_client, not_author_client, form_data
+):
+    """Создание заметок ограничено для каждого пользователя отдельно."""
+    settings.NOTES_RATE_LIMITS = {'notes:add': {'user': '2/m'}}
+    url = reverse('notes:add')
+    for number in range(2):
+        author_client.post(url, {**form_data, 'slug': f'slug-{number}'})
+    response = author_client.post(url, form_data)
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert 0 < int(response['Retry-After']) <= 30
+    assert Note.objects.count() == 2
+    # Чтение не ограничивается, другие пользователи — тоже.
+    assert author_client.get(url).status_code == HTTPStatus.OK
+    response = not_author_client.post(url, form_data)
+    assert response.status_code == HTTPStatus.FOUND
+
+
+@pytest.mark.django_db
+def test_login_limited_per_ip(settings, client):
+    """Попытки входа ограничены по IP-адресу."""
+    settings.NOTES_RATE_LIMITS = {'users:login': {'ip': '1/h'}}
+    url = reverse('users:login')
+    data = {'username': 'user', 'password': 'wrong'}
+    assert client.post(url, data).status_code == HTTPStatus.OK
+    response = client.post(url, data)
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert int(response['Retry-After']) > 3000
+    response = client.post(url, data, REMOTE_ADDR='10.0.0.1')
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_shed_in_flight(settings):
+    """Запросы сверх NOTES_SHED_MAX_IN_FLIGHT получают 503."""
+    settings.NOTES_SHED_MAX_IN_FLIGHT = 1
+    request = RequestFactory().get('/')
+    nested = []
+
+    def get_response(request):
+        # Пока первый запрос выполняется, второй отклоняется.
+        nested.append(middleware(request))
+        return HttpResponse()
+
+    middleware = LoadSheddingMiddleware(get_response)
+    assert middleware(request).status_code == HTTPStatus.OK
+    assert nested[0].status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert nested[0]['Retry-After'] == str(settings.NOTES_SHED_RETRY_AFTER)
+    assert middleware.in_flight == 0
+
+
+@pytest.mark.parametrize(
+    'queued_for, expected_status',
+    ((0.1, HTTPStatus.OK), (5, HTTPStatus.SERVICE_UNAVAILABLE)),
+)
+def test_shed_queue_latency(settings, queued_for, expected_status):
+    """Запрос, слишком долго ждавший в очереди прокси, получает 503."""
+    settings.NOTES_SHED_MAX_QUEUE_SECONDS = 1
+    middleware = LoadSheddingMiddleware(lambda request: HttpResponse())
+    started_ms = (time.time() - queued_for) * 1000
+    request = RequestFactory().get(
+        '/', HTTP_X_REQUEST_START=f't={started_ms:.0f}'
+    )
+    assert middleware(request).status_code == expected_status
+
+
+@pytest.mark.parametrize(
+    'proxies, forwarded, expected',
+    (
+        (0, '1.1.1.1', '10.0.0.1'),
+        (1, 'spoofed, 2.2.2.2', '2.2.2.2'),
+        (2, 'spoofed, 3.3.3.3, 2.2.2.2', '3.3.3.3'),
+        (2, '2.2.2.2', '10.0.0.1'),
+    ),
+)
+def test_client_ip_skips_client_supplied_addresses(
+        settings, proxies, forwarded, expected
+):
+    """Адрес клиента берётся из записи доверенного прокси."""
+    settings.NOTES_RATE_LIMIT_TRUSTED_PROXIES = proxies
+    request = RequestFactory().get(
+        '/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR=forwarded
+    )
+    assert client_ip(request) == expected
@@ -0,0 +1,75 @@
+"""Тесты маршрутизации чтения на реплики."""
+from types import SimpleNamespace
+
+import pytest
+
+from django.urls import reverse
+
+from notes import routers
+from notes.middleware import ReplicaStickinessMiddleware
+from notes.models import Note
+
+
+class FakeConnections(dict):
+    """Заменяет django.db.connections: {псевдоним: соединение}."""
+
+    @property
+    def databases(self):
+        return self
+
+
+@pytest.fixture
+def router():
+    return routers.ReplicaRouter()
+
+
+def test_reads_go_to_replica_writes_to_primary(router, monkeypatch):
+    """Чтение заметок идёт на реплику, запись — в основную базу."""
+    monkeypatch.setattr(routers, 'available_replicas', lambda: ['replica'])
+    assert router.db_for_read(Note) == 'replica'
+    assert router.db_for_write(Note) == 'default'
+    with routers.pin_primary():
+        assert router.db_for_read(Note) == 'default'
+
+
+def test_missing_replica_falls_back_to_primary(router, settings):
+    """Если реплика не описана в DATABASES, чтение идёт в default."""
+    settings.DATABASE_REPLICAS = ['missing']
+    assert router.db_for_read(Note) == 'default'
+
+
+def test_healthy_replica_is_not_checked_on_every_read(settings, monkeypatch):
+    """Проверка доступной реплики кешируется на короткое время."""
+    checks = []
+    replica = SimpleNamespace(
+        vendor='postgresql',
+        settings_dict={'NAME': 'replica'},
+        ensure_connection=lambda: checks.append(1),
+    )
+    monkeypatch.setattr(
+        routers, 'connections', FakeConnections(replica=replica)
+    )
+    settings.DATABASE_REPLICAS = ['replica']
+    monkeypatch.setattr(routers, '_down_until', {})
+    monkeypatch.setattr(routers, '_up_until', {})
+    for _ in range(3):
+        assert routers.available_replicas() == ['replica']
+    assert len(checks) == 1
+    now = routers.time.monotonic() + settings.NOTES_REPLICA_CHECK_SECONDS
+    assert routers.is_available('replica', now + 1)
+    assert len(checks) == 2
+
+
+def test_post_makes_next_reads_sticky(author_client, note, monkeypatch):
+    """После POST пользователь читает свои записи из основной базы."""
+    used = []
+    monkeypatch.setattr(routers, 'available_replicas', lambda: ['replica'])
+    monkeypatch.setattr(
+        routers.ReplicaRouter, 'db_for_read',
+        lambda self, model, **hints: used.append(routers._use_primary.get()),
+    )
+    response = author_client.post(reverse('notes:bulk_delete'))
+    assert ReplicaStickinessMiddleware.cookie_name in response.cookies
+    used.clear()
+    author_client.get(reverse('notes:list'))
+    assert used and all(used)
@@ -0,0 +1,123 @@
+"""Тесты нечёткого поиска и поиска похожих заметок."""
+from http import HTTPStatus
+
+import pytest
+
+from django.core.management import call_command
+from django.urls import reverse
+
+from notes import jobs, search
+from notes.models import Note, Task, TextBand, TitleTrigram
+
+TEXT = ('Купить молоко, хлеб и сыр в магазине у дома, '
+        'а потом зайти в аптеку за витаминами')
+
+
+@pytest.fixture
+def indexed(django_capture_on_commit_callbacks):
+    """Выполняет код и фоновые задачи индексации, поставленные им."""
+    class Indexed:
+        def __enter__(self):
+            self.capture = django_capture_on_commit_callbacks(execute=True)
+            self.capture.__enter__()
+
+        def __exit__(self, *exc_info):
+            self.capture.__exit__(*exc_info)
+            jobs.drain()
+
+    return Indexed()
+
+
+def test_normalize_transliterates():
+    """Кириллица и транслит приводятся к одному виду."""
+    assert search.normalize('Покупки, на НЕДЕЛЮ!') == 'pokupki na nedelyu'
+    assert search.trigrams('Покупки') == search.trigrams('pokupki')
+
+
+def test_bands_are_stable():
+    """Полосы MinHash не зависят от регистра и пусты для пустого текста."""
+    assert search.bands(TEXT) == search.bands(TEXT.upper())
+    assert len(search.bands(TEXT)) == search.BANDS
+    assert search.bands('!!!') == []
+
+
+def test_index_is_built_in_background(author, indexed):
+    """Индексы перестраиваются фоновой задачей после сохранения."""
+    with indexed:
+        note = Note.objects.create(title='Заметка', text=TEXT, author=author)
+        assert not TitleTrigram.objects.exists()
+    assert TitleTrigram.objects.filter(note=note).count() == len(
+        search.trigrams(note.title)
+    )
+    assert TextBand.objects.filter(note=note).count() == search.BANDS
+    with indexed:
+        note.title = 'Другой'
+        note.save()
+    assert set(
+        TitleTrigram.objects.filter(note=note).values_list(
+            'trigram', flat=True
+        )
+    ) == search.trigrams('Другой')
+
+
+def test_index_not_rebuilt_for_unchanged_note(note, indexed):
+    """Сохранение без изменения заголовка и текста не ставит задачу."""
+    note = Note.objects.get(pk=note.pk)
+    with indexed:
+        note.share()
+        assert not Task.objects.exists()
+
+
+@pytest.mark.parametrize('query', ('pokupki', 'Пакупки', 'покупк'))
+def test_list_fuzzy_title_search(author_client, author, query, indexed):
+    """Заметка находится по заголовку с опечаткой или в транслите."""
+    with indexed:
+        wanted = Note.objects.create(
+            title='Покупки', text='Молоко', slug='shopping', author=author
+        )
+        Note.objects.create(
+            title='Работа', text='Отчёт', slug='work', author=author
+        )
+    response = author_client.get(reverse('notes:list'), {'q': query})
+    assert list(response.context['object_list']) == [wanted]
+
+
+def test_title_search_skips_other_authors(not_author_client, note):
+    """Поиск не находит чужие заметки."""
+    search.index_note(note, 'default')
+    response = not_author_client.get(
+        reverse('notes:list'), {'q': note.title}
+    )
+    assert list(response.context['object_list']) == []
+
+
+def test_add_warns_about_duplicate(author_client, author, form_data, indexed):
+    """Форма находит похожую заметку при отправке и предупреждает о ней."""
+    with indexed:
+        original = Note.objects.create(
+            title='Список дел', text=TEXT, slug='todo', author=author
+        )
+    form_data['text'] = TEXT + ' и масла'
+    response = author_client.post(
+        reverse('notes:add'), form_data, follow=True
+    )
+    assert response.status_code == HTTPStatus.OK
+    assert Note.objects.count() == 2
+    messages = [str(message) for message in response.context['messages']]
+    assert messages == [f'Похожие заметки: «{original.title}».']
+
+
+def test_add_without_duplicates(author_client, note, form_data):
+    """Без похожих заметок предупреждения нет."""
+    search.index_note(note, 'default')
+    response = author_client.post(
+        reverse('notes:add'), form_data, follow=True
+    )
+    assert list(response.context['messages']) == []
+
+
+def test_rebuild_search_index(note):
+    """Команда заполняет индексы для существующих заметок."""
+    call_command('rebuild_search_index', stdout=None)
+    assert TitleTrigram.objects.filter(note=note).exists()
+    assert TextBand.objects.filter(note=note).count() == search.BANDS
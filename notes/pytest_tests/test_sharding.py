@@ -0,0 +1,106 @@
+"""Тесты распределения заметок по шардам."""
+import pytest
+
+from django.db import transaction
+from django.urls import reverse
+
+from notes import sharding
+from notes.models import Note, ShardAssignment, Tag, UserStats
+
+pytestmark = pytest.mark.django_db(databases=('default', 'shard'))
+
+
+@pytest.fixture
+def shards(settings):
+    settings.NOTES_SHARDS = ['default', 'shard']
+    settings.NOTES_SHARD_CACHE_TIMEOUT = 0
+
+
+@pytest.fixture
+def author_on_shard(shards, author):
+    sharding.set_placement(author.pk, 'shard', moving=False)
+    return author
+
+
+def test_views_use_author_shard(author_on_shard, author_client, form_data):
+    """Заметки пользователя создаются и читаются в его шарде."""
+    form_data['tags'] = 'тег'
+    author_client.post(reverse('notes:add'), data=form_data)
+    assert not Note.objects.using('default').exists()
+    note = Note.objects.using('shard').get()
+    assert note.tags.get().note_count == 1
+    response = author_client.get(reverse('notes:list'))
+    assert list(response.context['object_list']) == [note]
+    url = reverse('notes:detail', args=(note.slug,))
+    assert author_client.get(url).context['note'] == note
+
+
+def test_slug_is_unique_across_shards(
+    author_on_shard, not_author, not_author_client, form_data
+):
+    """Slug нельзя повторить, даже если заметка лежит в другом шарде."""
+    sharding.set_placement(not_author.pk, 'default', moving=False)
+    Note.objects.create(
+        title='Заметка', text='Текст', slug=form_data['slug'],
+        author=author_on_shard,
+    )
+    not_author_client.post(reverse('notes:add'), data=form_data)
+    assert not Note.objects.using('default').exists()
+
+
+def test_move_user_between_shards(shards, author, monkeypatch):
+    """Перенос копирует заметки и теги и удаляет их из старого шарда."""
+    monkeypatch.setattr(sharding, 'wait_for_caches', lambda: None)
+    sharding.set_placement(author.pk, 'default', moving=False)
+    note = Note.objects.create(
+        title='Заметка', text='Текст', slug='note-slug', author=author
+    )
+    note.set_tags(['тег'])
+    assert sharding.move_user(author.pk, 'shard', 10, 0) == 1
+    assert ShardAssignment.objects.get(user=author).shard == 'shard'
+    assert not Note.all_objects.using('default').exists()
+    moved = Note.objects.for_author(author).get()
+    assert moved.slug == note.slug
+    assert [tag.name for tag in moved.tags.all()] == ['тег']
+    assert not Tag.objects.using('default').exists()
+
+
+def test_writes_are_rejected_while_moving(
+    author_on_shard, author_client, form_data
+):
+    """Во время переноса изменения заметок временно недоступны."""
+    sharding.set_placement(author_on_shard.pk, 'shard', moving=True)
+    response = author_client.post(reverse('notes:add'), data=form_data)
+    assert response.status_code == 503
+    assert 'Retry-After' in response
+
+
+def test_admin_lists_selected_shard(author_on_shard, admin_client):
+    """В админке можно выбрать шард и открыть заметку из него."""
+    note = Note.objects.create(
+        title='Заметка', text='Текст', slug='note-slug', author=author_on_shard
+    )
+    url = reverse('admin:notes_note_changelist')
+    assert not admin_client.get(url).context['cl'].result_count
+    response = admin_client.get(url, {'shard': 'shard'})
+    assert list(response.context['cl'].result_list) == [note]
+    url = reverse('admin:notes_note_change', args=(note.pk,))
+    response = admin_client.get(url, {'_changelist_filters': 'shard=shard'})
+    assert response.context['original'] == note
+
+
+def test_stats_follow_shard_transaction(
+    author_on_shard, django_capture_on_commit_callbacks
+):
+    """Счётчики меняются только после фиксации транзакции шарда."""
+    with pytest.raises(RuntimeError), transaction.atomic(using='shard'):
+        Note.objects.create(
+            title='Откат', text='Текст', author=author_on_shard
+        )
+        raise RuntimeError
+    assert UserStats.for_user(author_on_shard.pk).note_count == 0
+    with django_capture_on_commit_callbacks(using='shard', execute=True):
+        Note.objects.create(
+            title='Заметка', text='Текст', author=author_on_shard
+        )
+    assert UserStats.for_user(author_on_shard.pk).note_count == 1
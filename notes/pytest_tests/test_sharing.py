@@ -0,0 +1,60 @@
+"""Тесты публичных ссылок на заметки."""
+from http import HTTPStatus
+
+from django.urls import reverse
+
+from notes.models import Note
+
+
+def share(author_client, note, django_capture_on_commit_callbacks, **data):
+    url = reverse('notes:share', args=(note.slug,))
+    with django_capture_on_commit_callbacks(execute=True):
+        author_client.post(url, data)
+    note.refresh_from_db()
+    return note.share_token
+
+
+def test_shared_page_is_public_and_cacheable(
+    client, author_client, note, django_capture_on_commit_callbacks,
+    django_assert_num_queries,
+):
+    """Страница по ссылке доступна анониму и кешируется."""
+    token = share(author_client, note, django_capture_on_commit_callbacks)
+    url = reverse('notes:shared', args=(token,))
+    response = client.get(url)
+    assert response.status_code == HTTPStatus.OK
+    assert note.text in response.content.decode()
+    assert 'public' in response['Cache-Control']
+    assert 's-maxage' in response['Cache-Control']
+    assert 'Vary' not in response
+    with django_assert_num_queries(0):
+        response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+
+def test_edit_purges_shared_page(
+    client, author_client, note, form_data,
+    django_capture_on_commit_callbacks,
+):
+    """После редактирования заметки публичная страница обновляется."""
+    token = share(author_client, note, django_capture_on_commit_callbacks)
+    url = reverse('notes:shared', args=(token,))
+    client.get(url)
+    form_data['slug'] = note.slug
+    with django_capture_on_commit_callbacks(execute=True):
+        author_client.post(reverse('notes:edit', args=(note.slug,)), form_data)
+    assert form_data['text'] in client.get(url).content.decode()
+
+
+def test_revoked_link_is_not_found(
+    client, author_client, note, django_capture_on_commit_callbacks
+):
+    """Отозванная ссылка сразу перестаёт работать."""
+    token = share(author_client, note, django_capture_on_commit_callbacks)
+    url = reverse('notes:shared', args=(token,))
+    client.get(url)
+    assert share(
+        author_client, note, django_capture_on_commit_callbacks, revoke=''
+    ) is None
+    assert client.get(url).status_code == HTTPStatus.NOT_FOUND
+    assert Note.objects.filter(share_token=token).count() == 0
@@ -0,0 +1,88 @@
+"""Тесты счётчиков и лимита заметок."""
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from notes.models import Note, Tag, UserStats
+from notes.views import QUOTA_EXCEEDED
+
+
+def test_counters_follow_create_edit_delete(author_client, author, form_data):
+    """Счётчики меняются при создании, изменении и удалении заметки."""
+    author_client.post(reverse('notes:add'), data=form_data)
+    stats = UserStats.objects.get(user=author)
+    assert stats.note_count == 1
+    assert stats.text_length == len(form_data['text'])
+    form_data['text'] = 'Текст подлиннее'
+    author_client.post(reverse('notes:edit', args=('new-slug',)), form_data)
+    stats.refresh_from_db()
+    assert stats.text_length == len(form_data['text'])
+    author_client.post(reverse('notes:delete', args=('new-slug',)))
+    stats.refresh_from_db()
+    assert (stats.note_count, stats.text_length) == (0, 0)
+
+
+def test_quota(author_client, author, note, form_data, settings):
+    """Пользователь не может превысить лимит заметок."""
+    settings.NOTES_MAX_PER_USER = 1
+    response = author_client.post(reverse('notes:add'), data=form_data)
+    assert QUOTA_EXCEEDED.format(limit=1) in response.content.decode()
+    assert Note.objects.count() == 1
+
+
+def test_quota_reserves_slot_once(
+    author_client, author, note, form_data, settings
+):
+    """Место под заметку занимается атомарно и учитывается один раз."""
+    settings.NOTES_MAX_PER_USER = 3
+    author_client.post(reverse('notes:add'), data=form_data)
+    assert UserStats.for_user(author.pk).note_count == 2
+    # Параллельный запрос уже занял последнее место.
+    assert UserStats.reserve(author.pk, 3)
+    assert not UserStats.reserve(author.pk, 3)
+    assert UserStats.for_user(author.pk).note_count == 3
+
+
+def test_header_shows_note_count(author_client, note):
+    """В шапке показано число заметок пользователя."""
+    response = author_client.get(reverse('notes:home'))
+    assert 'заметок: 1' in response.content.decode()
+
+
+def test_reconcile_fixes_drift(author, note):
+    """Команда reconcile_note_stats исправляет расхождения."""
+    UserStats.objects.filter(user=author).update(note_count=42)
+    call_command('reconcile_note_stats')
+    stats = UserStats.objects.get(user=author)
+    assert (stats.note_count, stats.text_length) == (1, len(note.text))
+
+
+def test_hard_delete_updates_counters(admin_client, author, note):
+    """Удаление заметки из админки уменьшает счётчики заметок и тегов."""
+    note.set_tags(['тег'])
+    admin_client.post(
+        reverse('admin:notes_note_delete', args=(note.pk,)), {'post': 'yes'}
+    )
+    assert not Note.all_objects.exists()
+    stats = UserStats.for_user(author.pk)
+    assert (stats.note_count, stats.text_length) == (0, 0)
+    assert Tag.objects.get().note_count == 0
+
+
+def test_reconcile_locks_stats_before_counting(author, note):
+    """Счётчики блокируются раньше, чем считаются заметки."""
+    for reconcile in (
+        lambda: call_command('reconcile_note_stats', stdout=None),
+        lambda: UserStats.reconcile(author.pk),
+    ):
+        with CaptureQueriesContext(connection) as queries:
+            reconcile()
+        tables = [
+            'stats' if 'notes_userstats' in query['sql'] else 'notes'
+            for query in queries.captured_queries
+            if query['sql'].startswith('SELECT')
+            and ('notes_userstats' in query['sql']
+                 or 'FROM "notes_note"' in query['sql'])
+        ]
+        assert tables.index('stats') < tables.index('notes')
@@ -0,0 +1,56 @@
+"""Тесты тегов заметок."""
+from django.core.management import call_command
+from django.urls import reverse
+
+from notes.models import Note, Tag
+
+
+def test_tags_are_saved_from_form(author_client, author, form_data):
+    """Теги из формы сохраняются и учитываются в счётчиках."""
+    form_data['tags'] = '#Работа, идеи работа'
+    author_client.post(reverse('notes:add'), data=form_data)
+    note = Note.objects.get()
+    assert sorted(tag.name for tag in note.tags.all()) == ['идеи', 'работа']
+    assert set(Tag.objects.values_list('note_count', flat=True)) == {1}
+    form_data['tags'] = 'идеи'
+    author_client.post(reverse('notes:edit', args=(note.slug,)), form_data)
+    assert dict(Tag.objects.values_list('name', 'note_count')) == {
+        'идеи': 1, 'работа': 0
+    }
+
+
+def test_list_filters_by_tag_in_constant_queries(
+    author_client, author, django_assert_max_num_queries
+):
+    """Фильтр по тегу работает, а число запросов не зависит от заметок."""
+    for i in range(10):
+        note = Note.objects.create(
+            title=f'Заметка {i}', text='Текст', slug=f'slug-{i}',
+            author=author,
+        )
+        note.set_tags(['чётные'] if i % 2 == 0 else ['нечётные', 'все'])
+    url = reverse('notes:list')
+    # Сессия, пользователь, заметки, их теги, облако тегов и счётчик шапки.
+    with django_assert_max_num_queries(6):
+        response = author_client.get(url, {'tag': 'чётные'})
+    assert len(response.context['object_list']) == 5
+    cloud = {tag.name: tag.note_count for tag in response.context['tag_cloud']}
+    assert cloud == {'чётные': 5, 'нечётные': 5, 'все': 5}
+
+
+def test_list_tag_filter_is_normalized(author_client, note):
+    """Фильтр по тегу не зависит от регистра и символа #."""
+    note.set_tags(['работа'])
+    response = author_client.get(reverse('notes:list'), {'tag': '#Работа'})
+    assert list(response.context['object_list']) == [note]
+    assert response.context['current_tag'] == 'работа'
+
+
+def test_soft_delete_and_reconcile_keep_tag_counts(author, note):
+    """Удаление заметки уменьшает счётчик тега, пересчёт его сохраняет."""
+    note.set_tags(['тег'])
+    Note.objects.filter(pk=note.pk).soft_delete()
+    assert Tag.objects.get().note_count == 0
+    Tag.objects.update(note_count=7)
+    call_command('reconcile_note_stats')
+    assert Tag.objects.get().note_count == 0
@@ -0,0 +1,96 @@
+"""Тесты прогрева процесса перед обслуживанием запросов."""
+from unittest import mock
+
+import pytest
+
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.template import engines
+
+from notes import warmup
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.mark.parametrize(
+    'get_application, warm_up',
+    (
+        (get_wsgi_application, warmup.warm_up),
+        (get_asgi_application, warmup.warm_up_in_thread),
+    ),
+)
+def test_warm_up_requests_pages(settings, get_application, warm_up, caplog):
+    """Прогрев проходит страницы через WSGI- и ASGI-приложение без ошибок."""
+    settings.NOTES_WARMUP_URLS = ['notes:home', 'users:login']
+    caplog.set_level('INFO', logger='notes.warmup')
+    report = warm_up(get_application())
+    assert set(report) == {
+        'urls', 'templates', 'databases',
+        'GET /', 'GET /auth/login/', 'total',
+    }
+    assert 'Прогрев завершён' in caplog.text
+    assert 'вернул' not in caplog.text
+
+
+@pytest.mark.parametrize(
+    'get_application, warm_up',
+    (
+        (get_wsgi_application, warmup.warm_up),
+        (get_asgi_application, warmup.warm_up_in_thread),
+    ),
+)
+def test_warm_up_not_recorded(settings, tmp_path, get_application, warm_up):
+    """Запросы прогрева не попадают в трассу нагрузочного теста."""
+    settings.NOTES_TRACE_FILE = tmp_path / 'trace.jsonl'
+    settings.NOTES_WARMUP_URLS = ['notes:home']
+    warm_up(get_application())
+    assert not settings.NOTES_TRACE_FILE.exists()
+
+
+def test_warm_up_compiles_templates():
+    """Шаблоны проекта компилируются в кеш загрузчика."""
+    assert warmup.compile_templates() > 0
+    loader = engines['django'].engine.template_loaders[0]
+    # Скомпилированные шаблоны остаются в кеше загрузчика.
+    assert 'base.html' in loader.get_template_cache
+
+
+def test_host(settings):
+    """Для запросов выбирается конкретное имя из ALLOWED_HOSTS."""
+    settings.ALLOWED_HOSTS = ['.example.com', 'notes.example.com']
+    assert warmup.host() == 'notes.example.com'
+    settings.ALLOWED_HOSTS = ['*']
+    assert warmup.host() == 'localhost'
+
+
+def test_warm_up_closes_connections():
+    """Соединения, открытые при прогреве, закрываются."""
+    with mock.patch.object(connections, 'close_all') as close_all:
+        warmup.warm_up()
+    close_all.assert_called_once_with()
+
+
+def test_persistent_connections_only():
+    """После fork заранее открываются только постоянные соединения."""
+    default = connections['default']
+    with mock.patch.dict(default.settings_dict, CONN_MAX_AGE=0), \
+            mock.patch.object(default, 'ensure_connection') as ensure:
+        warmup.open_persistent_connections()
+        ensure.assert_not_called()
+    with mock.patch.dict(default.settings_dict, CONN_MAX_AGE=60), \
+            mock.patch.object(default, 'ensure_connection') as ensure:
+        warmup.open_persistent_connections()
+        ensure.assert_called_once_with()
+
+
+def test_warm_up_survives_errors(settings, tmp_path, caplog):
+    """Ошибки шаблонов и адресов записываются в лог, прогрев продолжается."""
+    (tmp_path / 'broken.html').write_text('{% if %}')
+    engine = settings.TEMPLATES[0]
+    settings.TEMPLATES = [{**engine, 'DIRS': [tmp_path, *engine['DIRS']]}]
+    settings.NOTES_WARMUP_URLS = ['notes:missing', 'notes:home']
+    report = warmup.warm_up(get_wsgi_application())
+    assert 'GET /' in report
+    assert 'broken.html' in caplog.text
+    assert 'notes:missing' in caplog.text
@@ -0,0 +1,132 @@
+"""Маршрутизация запросов по шардам и репликам базы данных.
+
+ShardRouter направляет данные пользователя в его шард (см. sharding).
+Для остальных моделей запись идёт в default. Чтение моделей приложения notes
+распределяется по псевдонимам из DATABASE_REPLICAS, кроме запросов,
+для которых включено «прилипание» к основной базе (см.
+ReplicaStickinessMiddleware). Недоступная реплика на время
+исключается из ротации, а при отсутствии реплик чтение идёт в default.
+Доступная реплика повторно проверяется не чаще раза в
+NOTES_REPLICA_CHECK_SECONDS, чтобы проверка не замедляла каждый запрос.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from . import sharding
+
+_use_primary = ContextVar('use_primary', default=False)
+_down_until = {}
+_up_until = {}
+
+
+@contextmanager
+def pin_primary(enabled=True):
+    """Направляет все чтения внутри блока в основную базу."""
+    token = _use_primary.set(enabled)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+def is_available(alias, now=None):
+    """Проверяет реплику; недоступную исключает на время из ротации."""
+    now = time.monotonic() if now is None else now
+    if alias not in connections.databases or _down_until.get(alias, 0) > now:
+        return False
+    if _up_until.get(alias, 0) > now:
+        return True
+    connection = connections[alias]
+    try:
+        name = connection.settings_dict['NAME']
+        if connection.vendor == 'sqlite' and not Path(name).exists():
+            # SQLite молча создаст пустой файл вместо отсутствующей копии.
+            raise DatabaseError(f'Файл реплики {name} не найден.')
+        connection.ensure_connection()
+    except DatabaseError:
+        _up_until.pop(alias, None)
+        _down_until[alias] = now + settings.NOTES_REPLICA_RETRY_SECONDS
+        return False
+    _up_until[alias] = now + settings.NOTES_REPLICA_CHECK_SECONDS
+    return True
+
+
+def available_replicas():
+    now = time.monotonic()
+    return [
+        alias for alias in settings.DATABASE_REPLICAS
+        if is_available(alias, now)
+    ]
+
+
+class ReplicaRouter:
+    """Роутер: чтение заметок с реплик, запись в основную базу."""
+
+    app_labels = ('notes',)
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in self.app_labels:
+            return None
+        if _use_primary.get():
+            return DEFAULT_DB_ALIAS
+        replicas = available_replicas()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ShardRouter:
+    """Роутер: данные пользователя в шарде, определённом по автору.
+
+    Запросы без привязки к объекту роутер не обрабатывает: такие
+    querysets направляются в шард явно через Note.objects.for_author.
+    """
+
+    sharded_models = ('note', 'note_tags', 'tag', 'attachment',
+                      'attachmentupload', 'titletrigram', 'textband')
+
+    def is_sharded(self, model):
+        return (model._meta.app_label == 'notes'
+                and model._meta.model_name in self.sharded_models)
+
+    def author_id(self, instance):
+        author_id = getattr(instance, 'author_id', None)
+        if author_id is None and getattr(instance, 'note_id', None):
+            author_id = instance.note.author_id
+        return author_id
+
+    def db_for_read(self, model, instance=None, **hints):
+        if not self.is_sharded(model) or instance is None:
+            return None
+        alias = instance._state.db
+        # Для default решение о репликах принимает ReplicaRouter.
+        if alias in sharding.shards() and alias != DEFAULT_DB_ALIAS:
+            return alias
+        return None
+
+    def db_for_write(self, model, instance=None, **hints):
+        if not self.is_sharded(model) or instance is None:
+            return None
+        author_id = self.author_id(instance)
+        if author_id is None:
+            return None
+        return sharding.shard_for(author_id)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if self.is_sharded(obj1) and self.is_sharded(obj2):
+            return obj1._state.db == obj2._state.db
+        return None
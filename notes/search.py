@@ -0,0 +1,162 @@
+"""Нечёткий поиск по заголовкам и поиск похожих заметок.
+
+Строки приводятся к нижнему регистру и транслитерируются, поэтому
+«Покупки» и «pokupki» считаются одинаковыми.
+
+Для поиска по заголовку хранится инвертированный индекс триграмм
+(TitleTrigram): запрос читает только записи триграмм искомой строки,
+а не все заметки пользователя. Для текста при сохранении считается
+сигнатура MinHash, разбитая на полосы (LSH, TextBand): кандидатами в
+дубликаты считаются заметки, у которых совпала хотя бы одна полоса.
+Кандидаты затем проверяются точным сравнением.
+"""
+import operator
+import random
+import re
+import zlib
+from functools import reduce
+
+from django.conf import settings
+from django.db.models import Count, Q
+from pytils.translit import translify
+
+WORD_RE = re.compile(r'\w+')
+SHINGLE_SIZE = 3
+BANDS = 16
+ROWS = 4
+# Простое число Мерсенна для хеш-функций вида (a * x + b) % PRIME.
+PRIME = (1 << 61) - 1
+# Коэффициенты фиксированы: сигнатуры из базы должны совпадать с новыми.
+_random = random.Random(20240607)
+PERMUTATIONS = [
+    (_random.randrange(1, PRIME), _random.randrange(PRIME))
+    for _ in range(BANDS * ROWS)
+]
+
+
+def normalize(value):
+    """Строка в нижнем регистре латиницей, слова разделены пробелом."""
+    return ' '.join(WORD_RE.findall(translify(value.lower(), strict=False)))
+
+
+def trigrams(value):
+    """Множество триграмм слов строки, как в pg_trgm."""
+    grams = set()
+    for word in normalize(value).split():
+        padded = f'  {word} '
+        grams.update(
+            padded[start:start + 3] for start in range(len(padded) - 2)
+        )
+    return grams
+
+
+def similarity(first, second):
+    """Коэффициент Жаккара двух множеств."""
+    if not first or not second:
+        return 0
+    shared = len(first & second)
+    return shared / (len(first) + len(second) - shared)
+
+
+def shingles(text):
+    """Множество последовательностей из SHINGLE_SIZE слов текста."""
+    words = normalize(text).split()
+    if len(words) <= SHINGLE_SIZE:
+        return {' '.join(words)} if words else set()
+    return {
+        ' '.join(words[start:start + SHINGLE_SIZE])
+        for start in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def minhash(items):
+    """Сигнатура MinHash множества строк."""
+    hashes = [zlib.crc32(item.encode()) for item in items]
+    return [
+        min((a * value + b) % PRIME for value in hashes)
+        for a, b in PERMUTATIONS
+    ]
+
+
+def bands(text):
+    """Хеши полос сигнатуры MinHash текста: список (полоса, хеш)."""
+    items = shingles(text)
+    if not items:
+        return []
+    signature = minhash(items)
+    return [
+        (band, zlib.crc32(
+            ','.join(map(str, signature[band * ROWS:(band + 1) * ROWS]))
+            .encode()
+        ))
+        for band in range(BANDS)
+    ]
+
+
+def index_note(note, using, title=True, text=True):
+    """Перестраивает записи индексов заметки в базе using."""
+    from .models import TextBand, TitleTrigram
+
+    if title:
+        TitleTrigram.objects.using(using).filter(note=note).delete()
+        TitleTrigram.objects.using(using).bulk_create(
+            TitleTrigram(
+                note_id=note.pk, author_id=note.author_id, trigram=gram
+            )
+            for gram in trigrams(note.title)
+        )
+    if text:
+        TextBand.objects.using(using).filter(note=note).delete()
+        TextBand.objects.using(using).bulk_create(
+            TextBand(
+                note_id=note.pk, author_id=note.author_id,
+                band=band, bucket=bucket,
+            )
+            for band, bucket in bands(note.text)
+        )
+
+
+def search_titles(notes, author_id, query, limit=20):
+    """Заметки из notes с заголовком, похожим на query, лучшие первыми.
+
+    Из индекса берутся заметки с наибольшим числом общих триграмм, затем
+    они упорядочиваются по точному сходству заголовков.
+    """
+    from .models import TitleTrigram
+
+    grams = trigrams(query)
+    if not grams:
+        return []
+    candidates = TitleTrigram.objects.using(notes.db).filter(
+        author_id=author_id, trigram__in=grams
+    ).values('note').annotate(shared=Count('id')).order_by('-shared')
+    threshold = settings.NOTES_TITLE_SIMILARITY
+    scored = [
+        (similarity(grams, trigrams(note.title)), note)
+        for note in notes.filter(
+            pk__in=[row['note'] for row in candidates[:limit * 5]]
+        )
+    ]
+    scored.sort(key=lambda pair: (-pair[0], pair[1].pk))
+    return [note for score, note in scored if score >= threshold][:limit]
+
+
+def find_duplicates(notes, author_id, text, limit=5):
+    """Заметки из notes с текстом, похожим на text."""
+    from .models import TextBand
+
+    text_bands = bands(text)
+    if not text_bands:
+        return []
+    candidates = TextBand.objects.using(notes.db).filter(
+        reduce(operator.or_, (
+            Q(band=band, bucket=bucket) for band, bucket in text_bands
+        )),
+        author_id=author_id,
+    ).values_list('note', flat=True).distinct()
+    items = shingles(text)
+    threshold = settings.NOTES_DUPLICATE_SIMILARITY
+    return [
+        note for note in notes.filter(pk__in=list(candidates[:limit * 5]))
+        if similarity(items, shingles(note.text)) >= threshold
+    ][:limit]
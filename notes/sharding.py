@@ -0,0 +1,182 @@
+"""Распределение заметок пользователей по базам данных (шардам).
+
+Все данные пользователя (заметки, теги, вложения) хранятся в одной базе
+из NOTES_SHARDS. Шард определяется по справочнику ShardAssignment, а для
+пользователей без записи — по стабильному хешу id; при первом обращении
+результат записывается в справочник, поэтому добавление шардов не
+перемещает уже существующих пользователей.
+
+Реплики из DATABASE_REPLICAS обслуживают только шард default.
+"""
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from . import search
+
+CACHE_KEY = 'notes:shard:{user_id}'
+
+
+class ShardMoving(Exception):
+    """Заметки пользователя переносятся, запись временно недоступна."""
+
+
+def shards():
+    return settings.NOTES_SHARDS
+
+
+def hashed_shard(user_id):
+    """Шард пользователя по стабильному хешу его id."""
+    aliases = shards()
+    return aliases[zlib.crc32(str(user_id).encode()) % len(aliases)]
+
+
+def lookup(user_id):
+    """Возвращает пару (шард, идёт ли перенос) для пользователя."""
+    aliases = shards()
+    if len(aliases) == 1:
+        return aliases[0], False
+    key = CACHE_KEY.format(user_id=user_id)
+    placement = cache.get(key)
+    if placement is None:
+        from .models import ShardAssignment
+        assignment, _ = ShardAssignment.objects.using(
+            DEFAULT_DB_ALIAS
+        ).get_or_create(
+            user_id=user_id, defaults={'shard': hashed_shard(user_id)}
+        )
+        placement = (assignment.shard, assignment.moving)
+        cache.set(key, placement, settings.NOTES_SHARD_CACHE_TIMEOUT)
+    return placement
+
+
+def shard_for(user_id):
+    return lookup(user_id)[0]
+
+
+def is_moving(user_id):
+    return lookup(user_id)[1]
+
+
+def for_author(queryset, author_id, primary=False):
+    """Направляет queryset в шард автора.
+
+    Для шарда default выбор базы остаётся роутерам, чтобы чтение могло
+    идти с реплик; primary=True принудительно читает из основной базы.
+    """
+    alias = shard_for(author_id)
+    if primary or alias != DEFAULT_DB_ALIAS:
+        queryset = queryset.using(alias)
+    return queryset
+
+
+def set_placement(user_id, shard, moving):
+    from .models import ShardAssignment
+    ShardAssignment.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        user_id=user_id, defaults={'shard': shard, 'moving': moving}
+    )
+    cache.delete(CACHE_KEY.format(user_id=user_id))
+
+
+def wait_for_caches():
+    """Ждёт, пока все процессы увидят новое значение справочника."""
+    time.sleep(settings.NOTES_SHARD_CACHE_TIMEOUT)
+
+
+def copy_user(user_id, source, target, batch_size, pause):
+    """Копирует теги, заметки и вложения пользователя в другой шард.
+
+    Заметки получают в целевой базе новые id, связи переносятся по
+    соответствию старых и новых id. Незавершённые загрузки вложений не
+    переносятся. Возвращает число заметок.
+    """
+    from .models import Attachment, Note, Tag
+
+    tag_ids = {}
+    for tag in Tag.objects.using(source).filter(author_id=user_id):
+        old_pk, tag.pk = tag.pk, None
+        tag.save(using=target, force_insert=True)
+        tag_ids[old_pk] = tag.pk
+    through = Note.tags.through
+    notes = Note.all_objects.using(source).filter(
+        author_id=user_id
+    ).order_by('pk')
+    copied, last_pk = 0, 0
+    while True:
+        batch = list(notes.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return copied
+        last_pk = batch[-1].pk
+        with transaction.atomic(using=target):
+            note_ids = {}
+            for note in batch:
+                old_pk, note.pk = note.pk, None
+                # Model.save без Note.save: счётчики при переносе не меняются.
+                note.save_base(using=target, force_insert=True)
+                search.index_note(note, target)
+                note_ids[old_pk] = note.pk
+            through.objects.using(target).bulk_create(
+                through(note_id=note_ids[link.note_id],
+                        tag_id=tag_ids[link.tag_id])
+                for link in through.objects.using(source).filter(
+                    note_id__in=note_ids
+                )
+            )
+            attachments = list(Attachment.objects.using(source).filter(
+                note_id__in=note_ids
+            ))
+            for attachment in attachments:
+                attachment.pk = None
+                attachment.note_id = note_ids[attachment.note_id]
+            Attachment.objects.using(target).bulk_create(attachments)
+        copied += len(batch)
+        time.sleep(pause)
+
+
+def delete_user_data(user_id, alias, batch_size, pause):
+    """Удаляет заметки и теги пользователя из шарда порциями."""
+    from .models import Note, Tag
+    from .purge import purge_notes
+
+    deleted = purge_notes(
+        Note.all_objects.using(alias).filter(author_id=user_id),
+        batch_size, pause,
+    )
+    Tag.objects.using(alias).filter(author_id=user_id).delete()
+    return deleted
+
+
+def has_user_data(user_id):
+    """Остались ли у пользователя заметки или теги в каком-либо шарде."""
+    from .models import Note, Tag
+
+    return any(
+        Note.all_objects.using(alias).filter(author_id=user_id).exists()
+        or Tag.objects.using(alias).filter(author_id=user_id).exists()
+        for alias in shards()
+    )
+
+
+def move_user(user_id, target, batch_size, pause):
+    """Переносит данные пользователя в шард target без остановки сервиса.
+
+    На время переноса чтение идёт из старого шарда, а изменения заметок
+    пользователя отклоняются. Возвращает число перенесённых заметок.
+    """
+    if target not in shards():
+        raise ValueError(f'Неизвестный шард: {target}')
+    source = shard_for(user_id)
+    if source == target:
+        return 0
+    set_placement(user_id, source, moving=True)
+    wait_for_caches()
+    # Остатки прерванного переноса в целевом шарде не нужны.
+    delete_user_data(user_id, target, batch_size, pause)
+    copied = copy_user(user_id, source, target, batch_size, pause)
+    set_placement(user_id, target, moving=False)
+    wait_for_caches()
+    delete_user_data(user_id, source, batch_size, pause)
+    return copied
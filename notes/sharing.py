@@ -0,0 +1,64 @@
+"""Публичные ссылки на заметки.
+
+Страница заметки по ссылке рендерится один раз и хранится в общем кеше
+вместе с ETag. При изменении заметки или отзыве ссылки копия в кеше
+удаляется сразу, а граничные кеши перепроверяют её по ETag.
+"""
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+
+from . import sharding
+
+CACHE_KEY = 'notes:shared:{token}'
+
+
+def new_token():
+    """Случайный токен для публичной ссылки."""
+    return secrets.token_urlsafe(16)
+
+
+def share_cache():
+    return caches[settings.NOTES_SHARE_CACHE]
+
+
+def purge(*tokens):
+    """Удаляет отрендеренные страницы с указанными токенами из кеша."""
+    tokens = [token for token in tokens if token]
+    if tokens:
+        share_cache().delete_many(
+            [CACHE_KEY.format(token=token) for token in tokens]
+        )
+
+
+def load_note(token):
+    """Ищет заметку по токену в основных базах всех шардов.
+
+    Копия попадёт в кеш, поэтому реплики не используются; по токену
+    нельзя определить шард, но запрос выполняется только при промахе.
+    """
+    from .models import Note
+
+    for alias in sharding.shards():
+        note = Note.objects.using(alias).filter(share_token=token).first()
+        if note is not None:
+            return note
+    return None
+
+
+def get_page(token):
+    """Возвращает (etag, html) страницы или None, если ссылки нет."""
+    key = CACHE_KEY.format(token=token)
+    page = share_cache().get(key)
+    if page is None:
+        note = load_note(token)
+        if note is None:
+            return None
+        html = render_to_string('notes/shared.html', {'note': note})
+        etag = '"{}"'.format(hashlib.sha256(html.encode()).hexdigest()[:32])
+        page = (etag, html)
+        share_cache().set(key, page, settings.NOTES_SHARE_CACHE_TIMEOUT)
+    return page
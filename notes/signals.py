@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+
+from . import sharding
+from .models import Attachment, AttachmentUpload, Note, Tag
+from .purge import AccountNotPurged
+from .tasks import release_blob
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def guard_account_deletion(sender, instance, **kwargs):
+    """Запрещает удалять пользователя вместе с заметками каскадом.
+
+    Каскад удалил бы все заметки одной долгой транзакцией и не нашёл бы
+    данные в других шардах. Пользователей удаляет purge_notes после
+    schedule_account_deletion.
+    """
+    if sharding.has_user_data(instance.pk):
+        raise AccountNotPurged(
+            f'У пользователя {instance} остались заметки: используйте '
+            'schedule_account_deletion.'
+        )
+
+
+@receiver(post_delete, sender=Attachment)
+def release_attachment_blob(sender, instance, using, **kwargs):
+    """Удаляет файл вложения, когда на него больше никто не ссылается."""
+    release_blob.enqueue(
+        key=f'release-blob:{instance.sha256}',
+        sha256=instance.sha256,
+        using=using,
+    )
+
+
+@receiver(post_delete, sender=AttachmentUpload)
+def remove_upload_part(sender, instance, **kwargs):
+    """Удаляет временный файл прерванной загрузки."""
+    instance.path.unlink(missing_ok=True)
+
+
+@receiver(m2m_changed, sender=Note.tags.through)
+def update_tag_counts(
+    sender, instance, action, reverse, pk_set, using, **kwargs
+):
+    """Поддерживает Tag.note_count при изменении тегов заметок."""
+    deltas = {'post_add': 1, 'post_remove': -1}
+    if reverse:
+        # instance — тег, pk_set — заметки.
+        tags = Tag.objects.using(using).filter(pk=instance.pk)
+        if action == 'post_clear':
+            tags.update(note_count=0)
+        elif action in deltas:
+            tags.update(
+                note_count=F('note_count') + deltas[action] * len(pk_set)
+            )
+        return
+    if action == 'pre_clear':
+        instance._cleared_tag_pks = set(
+            instance.tags.values_list('pk', flat=True)
+        )
+        return
+    if action == 'post_clear':
+        action, pk_set = 'post_remove', instance.__dict__.pop(
+            '_cleared_tag_pks', set()
+        )
+    if action in deltas and pk_set:
+        Tag.objects.using(using).filter(pk__in=pk_set).update(
+            note_count=F('note_count') + deltas[action]
+        )
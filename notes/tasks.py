@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.db import transaction
+
+from . import search, sharding, sharing
+from .attachments import blob_age, blob_lock, remove_blob
+from .jobs import task
+from .models import Attachment, Note
+
+
+@task('notes.release_blob')
+def release_blob(sha256):
+    """Удаляет файл вложения, если на него не ссылается ни один шард.
+
+    Недавно изменённый файл мог только что получить ссылку, запись о
+    которой ещё не сохранена: проверка откладывается.
+    """
+    with blob_lock():
+        if any(
+            Attachment.objects.using(alias).filter(sha256=sha256).exists()
+            for alias in sharding.shards()
+        ):
+            return
+        age = blob_age(sha256)
+        if age is None:
+            return
+        grace = settings.NOTES_ATTACHMENTS_BLOB_GRACE
+        if age < grace:
+            release_blob.enqueue(
+                key=f'release-blob:{sha256}',
+                delay=grace - age,
+                sha256=sha256,
+            )
+            return
+        remove_blob(sha256)
+
+
+@task('notes.warm_shared_page')
+def warm_shared_page(token):
+    """Заранее рендерит публичную страницу заметки после изменения."""
+    sharing.purge(token)
+    sharing.get_page(token)
+
+
+@task('notes.index_note')
+def index_note(note_id, alias, title, text):
+    """Перестраивает индексы поиска заметки по её текущему состоянию."""
+    note = Note.all_objects.using(alias).filter(pk=note_id).first()
+    if note is None:
+        return
+    with transaction.atomic(using=alias):
+        search.index_note(note, alias, title=title, text=text)
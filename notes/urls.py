@@ -11,5 +11,36 @@ urlpatterns = [
     path('note/<slug:slug>/', views.NoteDetail.as_view(), name='detail'),
     path('delete/<slug:slug>/', views.NoteDelete.as_view(), name='delete'),
     path('notes/', views.NotesList.as_view(), name='list'),
+    path(
+        'notes/delete/',
+        views.NoteBulkDelete.as_view(),
+        name='bulk_delete',
+    ),
     path('done/', views.NoteSuccess.as_view(), name='success'),
+    path(
+        'note/<slug:slug>/share/',
+        views.NoteShare.as_view(),
+        name='share',
+    ),
+    path('s/<str:token>/', views.SharedNote.as_view(), name='shared'),
+    path(
+        'note/<slug:slug>/attach/',
+        views.AttachmentCreate.as_view(),
+        name='attach',
+    ),
+    path(
+        'note/<slug:slug>/uploads/',
+        views.AttachmentUploadStart.as_view(),
+        name='upload_start',
+    ),
+    path(
+        'uploads/<uuid:pk>/',
+        views.AttachmentUploadChunk.as_view(),
+        name='upload_chunk',
+    ),
+    path(
+        'attachments/<int:pk>/',
+        views.AttachmentDownload.as_view(),
+        name='attachment',
+    ),
 ]
@@ -1,9 +1,37 @@
+import mimetypes
+import os
+from http import HTTPStatus
+
+from django.conf import settings
+from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import router, transaction
+from django.http import (
+    FileResponse, Http404, HttpResponse, HttpResponseBadRequest,
+    HttpResponseRedirect, JsonResponse
+)
+from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control
+)
 from django.views import generic
 
-from .forms import NoteForm
-from .models import Note
+from . import search, sharding, sharing
+from .attachments import (
+    RangeFileWrapper, append_chunk, attachments_root, commit_blob,
+    content_disposition, parse_content_range, parse_range, store_uploaded_file
+)
+from .forms import (
+    AttachmentForm, AttachmentUploadForm, NoteForm, parse_tags
+)
+from .middleware import SAFE_METHODS
+from .models import Attachment, AttachmentUpload, Note, Tag, UserStats
+from .tasks import warm_shared_page
+
+QUOTA_EXCEEDED = 'Достигнут лимит заметок: {limit}.'
+MOVING = 'Заметки переносятся на другой сервер, повторите попытку позже.'
+DUPLICATES = 'Похожие заметки: {titles}.'
 
 
 class Home(generic.TemplateView):
@@ -16,44 +44,376 @@ class NoteSuccess(LoginRequiredMixin, generic.TemplateView):
     template_name = 'notes/success.html'
 
 
-class NoteBase(LoginRequiredMixin):
+class ShardWriteMixin(LoginRequiredMixin):
+    """Отклоняет изменения, пока данные пользователя переносятся."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if (request.method not in SAFE_METHODS
+                and request.user.is_authenticated
+                and sharding.is_moving(request.user.pk)):
+            response = HttpResponse(
+                MOVING, status=HTTPStatus.SERVICE_UNAVAILABLE
+            )
+            response['Retry-After'] = settings.NOTES_SHARD_CACHE_TIMEOUT
+            return response
+        return super().dispatch(request, *args, **kwargs)
+
+
+class NoteBase(ShardWriteMixin):
     """Базовый класс для остальных CBV."""
     model = Note
     success_url = reverse_lazy('notes:success')
 
     def get_queryset(self):
         """Пользователь может работать только со своими заметками."""
-        return self.model.objects.filter(author=self.request.user)
+        return self.model.objects.for_author(self.request.user)
+
+
+class DuplicateWarningMixin:
+    """Предупреждает о похожих заметках, найденных формой при проверке."""
 
+    def warn_duplicates(self, form):
+        if form.duplicates:
+            messages.warning(self.request, DUPLICATES.format(
+                titles=', '.join(
+                    f'«{other.title}»' for other in form.duplicates
+                )
+            ))
 
-class NoteCreate(NoteBase, generic.CreateView):
+
+class NoteCreate(DuplicateWarningMixin, NoteBase, generic.CreateView):
     """Добавление заметки."""
     template_name = 'notes/form.html'
     form_class = NoteForm
 
+    def get_form_kwargs(self):
+        """Автор нужен форме, чтобы искать похожие заметки."""
+        kwargs = super().get_form_kwargs()
+        kwargs['instance'] = Note(author=self.request.user)
+        return kwargs
+
     def form_valid(self, form):
+        limit = settings.NOTES_MAX_PER_USER
         new_note = form.save(commit=False)
         new_note.author = self.request.user
-        new_note.save()
-        return super().form_valid(form)
+        if limit is None:
+            new_note.save()
+        else:
+            # Если заметку сохранить не удастся, место освободит откат.
+            with transaction.atomic(using=router.db_for_write(UserStats)):
+                if not UserStats.reserve(self.request.user.pk, limit):
+                    form.add_error(None, QUOTA_EXCEEDED.format(limit=limit))
+                    return self.form_invalid(form)
+                new_note._reserved = True
+                new_note.save()
+        response = super().form_valid(form)
+        self.warn_duplicates(form)
+        return response
 
 
-class NoteUpdate(NoteBase, generic.UpdateView):
+class NoteUpdate(DuplicateWarningMixin, NoteBase, generic.UpdateView):
     """Редактирование заметки."""
     template_name = 'notes/form.html'
     form_class = NoteForm
 
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        self.warn_duplicates(form)
+        if self.object.share_token:
+            # Публичная страница перерисуется в фоне, а не в этом запросе.
+            warm_shared_page.enqueue(
+                key=f'warm-shared:{self.object.share_token}',
+                token=self.object.share_token,
+                using=self.object._state.db,
+            )
+        return response
+
 
 class NoteDelete(NoteBase, generic.DeleteView):
     """Удаление заметки."""
     template_name = 'notes/delete.html'
 
+    def delete(self, request, *args, **kwargs):
+        """Заметка помечается удалённой, строки удаляет purge_notes."""
+        self.object = self.get_object()
+        self.get_queryset().filter(pk=self.object.pk).soft_delete()
+        return HttpResponseRedirect(self.get_success_url())
+
+
+class NoteBulkDelete(NoteBase, generic.View):
+    """Удаление выбранных в списке заметок одним запросом."""
+
+    def post(self, request):
+        ids = [pk for pk in request.POST.getlist('notes') if pk.isdigit()]
+        self.get_queryset().filter(pk__in=ids).soft_delete()
+        return HttpResponseRedirect(self.success_url)
+
 
 class NotesList(NoteBase, generic.ListView):
     """Список всех заметок пользователя."""
     template_name = 'notes/list.html'
 
+    def get_queryset(self):
+        """Теги подгружаются одним запросом для всей страницы.
+
+        С параметром q заметки ищутся по похожести заголовка.
+        """
+        queryset = super().get_queryset().prefetch_related('tags')
+        tag = self.current_tag()
+        if tag:
+            queryset = queryset.filter(tags__name=tag)
+        query = self.request.GET.get('q', '').strip()
+        if query:
+            return search.search_titles(
+                queryset, self.request.user.pk, query
+            )
+        return queryset
+
+    def current_tag(self):
+        """Тег из параметра tag в том виде, в каком он хранится."""
+        names = parse_tags(self.request.GET.get('tag', ''))
+        return names[0] if names else ''
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['current_tag'] = self.current_tag()
+        context['query'] = self.request.GET.get('q', '')
+        context['tag_cloud'] = sharding.for_author(
+            Tag.objects.filter(author=self.request.user, note_count__gt=0),
+            self.request.user.pk,
+        ).order_by('-note_count', 'name')
+        return context
+
 
 class NoteDetail(NoteBase, generic.DetailView):
     """Заметка подробно."""
     template_name = 'notes/detail.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['attachment_form'] = AttachmentForm()
+        return context
+
+
+class NoteShare(NoteBase, generic.detail.SingleObjectMixin, generic.View):
+    """Включение и отзыв публичной ссылки на заметку."""
+
+    def post(self, request, *args, **kwargs):
+        note = self.get_object()
+        if 'revoke' in request.POST:
+            note.revoke_share()
+        else:
+            note.share()
+        return redirect('notes:detail', slug=note.slug)
+
+
+class SharedNote(generic.View):
+    """Публичная страница заметки только для чтения.
+
+    Страница берётся из общего кеша и отдаётся с ETag и заголовками,
+    позволяющими граничному кешу обслуживать повторные запросы.
+    Представление не обращается к пользователю и сессии, чтобы ответ
+    не получил Vary: Cookie.
+    """
+
+    def get(self, request, token):
+        page = sharing.get_page(token)
+        if page is None:
+            raise Http404('Ссылка недействительна.')
+        etag, html = page
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(html)
+        response['ETag'] = etag
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=settings.NOTES_SHARE_MAX_AGE,
+            s_maxage=settings.NOTES_SHARE_S_MAXAGE,
+        )
+        return response
+
+
+class AttachmentCreate(NoteBase, generic.detail.SingleObjectMixin,
+                       generic.FormView):
+    """Прикрепление файла к заметке через обычную форму."""
+    template_name = 'notes/detail.html'
+    form_class = AttachmentForm
+    http_method_names = ('post',)
+
+    def post(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        return super().post(request, *args, **kwargs)
+
+    def form_valid(self, form):
+        uploaded_file = form.cleaned_data['file']
+        sha256, size = store_uploaded_file(uploaded_file)
+        Attachment.objects.create(
+            note=self.object,
+            name=os.path.basename(uploaded_file.name),
+            sha256=sha256,
+            size=size,
+            content_type=uploaded_file.content_type or '',
+        )
+        return redirect('notes:detail', slug=self.object.slug)
+
+    def get_context_data(self, **kwargs):
+        kwargs.setdefault('attachment_form', kwargs.get('form'))
+        return super().get_context_data(**kwargs)
+
+
+class AttachmentUploadStart(NoteBase, generic.View):
+    """Начало загрузки вложения по частям."""
+
+    def post(self, request, slug):
+        note = get_object_or_404(self.get_queryset(), slug=slug)
+        form = AttachmentUploadForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse(
+                {'errors': form.errors}, status=HTTPStatus.BAD_REQUEST
+            )
+        upload = form.save(commit=False)
+        upload.note = note
+        upload.name = os.path.basename(upload.name)
+        upload.save()
+        return JsonResponse(
+            {'id': str(upload.id), 'offset': 0, 'size': upload.size},
+            status=HTTPStatus.CREATED,
+        )
+
+
+class AttachmentUploadChunk(ShardWriteMixin, generic.View):
+    """Приём очередной части файла и возобновление загрузки.
+
+    GET возвращает количество уже принятых байт. PUT принимает тело с
+    заголовком Content-Range и дописывает его в файл без буферизации в
+    памяти.
+    """
+
+    def get_queryset(self):
+        return sharding.for_author(
+            # Как и NoteManager, скрываем вложения удалённых заметок.
+            AttachmentUpload.objects.filter(
+                note__author=self.request.user, note__is_deleted=False
+            ),
+            self.request.user.pk,
+        )
+
+    def get(self, request, pk):
+        upload = get_object_or_404(self.get_queryset(), pk=pk)
+        return JsonResponse(
+            {'id': str(upload.id), 'offset': upload.stored_offset(),
+             'size': upload.size}
+        )
+
+    def put(self, request, pk):
+        try:
+            start, end, total = parse_content_range(
+                request.headers.get('Content-Range')
+            )
+        except ValueError:
+            return HttpResponseBadRequest('Некорректный Content-Range.')
+        with transaction.atomic(using=sharding.shard_for(request.user.pk)):
+            upload = get_object_or_404(
+                self.get_queryset().select_for_update(), pk=pk
+            )
+            stored = upload.stored_offset()
+            if stored != upload.offset:
+                # Дописывать к неполному файлу нельзя: клиент повторит
+                # загрузку с сохранившегося смещения.
+                upload.offset = stored
+                upload.save(update_fields=('offset', 'updated'))
+            if total != upload.size or start != upload.offset:
+                return JsonResponse(
+                    {'offset': upload.offset}, status=HTTPStatus.CONFLICT
+                )
+            length = end - start + 1
+            written = append_chunk(upload.path, start, request, length)
+            upload.offset += written
+            if upload.offset < upload.size:
+                upload.save(update_fields=('offset', 'updated'))
+                return JsonResponse(
+                    {'id': str(upload.id), 'offset': upload.offset,
+                     'size': upload.size}
+                )
+            attachment = Attachment.objects.create(
+                note=upload.note,
+                name=upload.name,
+                sha256=commit_blob(upload.path),
+                size=upload.size,
+                content_type=mimetypes.guess_type(upload.name)[0] or '',
+            )
+            upload.delete()
+        return JsonResponse(
+            {'attachment': attachment.pk, 'size': attachment.size},
+            status=HTTPStatus.CREATED,
+        )
+
+
+class AttachmentDownload(LoginRequiredMixin, generic.View):
+    """Скачивание вложения с поддержкой HTTP Range.
+
+    Если настроен NOTES_ATTACHMENTS_SENDFILE, отдачу файла выполняет
+    фронтенд-сервер, а приложение только проверяет права доступа.
+    """
+
+    def get(self, request, pk):
+        attachment = get_object_or_404(
+            sharding.for_author(
+                Attachment.objects.filter(
+                    note__author=request.user, note__is_deleted=False
+                ),
+                request.user.pk,
+            ),
+            pk=pk,
+        )
+        content_type = attachment.content_type or 'application/octet-stream'
+        sendfile = settings.NOTES_ATTACHMENTS_SENDFILE
+        if sendfile:
+            return self.offload(attachment, content_type, sendfile)
+        try:
+            byte_range = parse_range(
+                request.headers.get('Range'), attachment.size
+            )
+        except ValueError:
+            response = HttpResponse(
+                status=HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+            )
+            response['Content-Range'] = f'bytes */{attachment.size}'
+            return response
+        try:
+            filelike = open(attachment.path, 'rb')
+        except FileNotFoundError:
+            raise Http404('Файл вложения не найден.')
+        if byte_range is None:
+            response = FileResponse(
+                filelike, as_attachment=True, filename=attachment.name,
+                content_type=content_type,
+            )
+        else:
+            start, end = byte_range
+            length = end - start + 1
+            response = FileResponse(
+                RangeFileWrapper(filelike, start, length),
+                as_attachment=True, filename=attachment.name,
+                content_type=content_type,
+                status=HTTPStatus.PARTIAL_CONTENT,
+            )
+            response['Content-Length'] = length
+            response['Content-Range'] = (
+                f'bytes {start}-{end}/{attachment.size}'
+            )
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    def offload(self, attachment, content_type, sendfile):
+        response = HttpResponse(content_type=content_type)
+        response['Content-Disposition'] = content_disposition(attachment.name)
+        if sendfile == 'x-accel-redirect':
+            relative = attachment.path.relative_to(attachments_root())
+            response['X-Accel-Redirect'] = (
+                settings.NOTES_ATTACHMENTS_ACCEL_PREFIX + relative.as_posix()
+            )
+        else:
+            response['X-Sendfile'] = str(attachment.path)
+        return response
@@ -0,0 +1,228 @@
+"""Прогрев процесса перед обслуживанием запросов.
+
+Django многое делает лениво: заполняет URL-резолверы при первом reverse,
+компилирует шаблоны при первом рендеринге, открывает соединения с базой
+при первом запросе к ней. warm_up выполняет эту работу заранее, чтобы
+первый запрос нового воркера обслуживался так же быстро, как остальные.
+Вызывается из yanote/wsgi.py и yanote/asgi.py, если включён NOTES_WARMUP.
+
+Соединения, открытые при прогреве, в конце закрываются: процесс может
+быть мастером, от которого fork создаёт воркеры, а поток прогрева не
+обслуживает запросы. Постоянные соединения (CONN_MAX_AGE не 0) заранее
+открывает open_persistent_connections в процессе воркера после fork.
+"""
+import asyncio
+import io
+import logging
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.template import TemplateSyntaxError, engines
+from django.urls import NoReverseMatch, get_resolver, reverse
+
+from .middleware import WARMUP_KEY
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def timed(report, step):
+    """Замеряет шаг прогрева.
+
+    Ошибка шага записывается в лог и не прерывает прогрев: прогрев лишь
+    ускоряет первые запросы и не должен мешать запуску воркера.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        logger.exception('Прогрев: шаг %s завершился ошибкой.', step)
+    report[step] = time.perf_counter() - started
+
+
+def resolve_urls():
+    """Заполняет резолверы всех пространств имён и ленивые адреса."""
+    resolvers = [get_resolver()]
+    while resolvers:
+        resolver = resolvers.pop()
+        # Обращение к reverse_dict заполняет резолвер.
+        resolver.reverse_dict
+        resolvers.extend(
+            nested for _, nested in resolver.namespace_dict.values()
+        )
+    str(settings.LOGIN_URL)
+    str(settings.LOGIN_REDIRECT_URL)
+    for name in settings.NOTES_WARMUP_URLS:
+        try:
+            reverse(name)
+        except NoReverseMatch:
+            logger.exception('Прогрев: адрес %s не найден.', name)
+
+
+def compile_templates():
+    """Компилирует шаблоны проекта в кеш загрузчика; возвращает их число.
+
+    Шаблон с ошибкой пропускается: она проявится при его рендеринге.
+    """
+    compiled = 0
+    for engine in engines.all():
+        for directory in map(Path, engine.dirs):
+            for path in directory.rglob('*.html'):
+                name = path.relative_to(directory).as_posix()
+                try:
+                    engine.get_template(name)
+                except TemplateSyntaxError:
+                    logger.exception('Прогрев: ошибка в шаблоне %s.', name)
+                    continue
+                compiled += 1
+    return compiled
+
+
+def connect_databases(persistent_only=False):
+    """Открывает соединения с базами в текущем потоке.
+
+    persistent_only — только с базами, где соединение переживает запрос.
+    """
+    for connection in connections.all():
+        if persistent_only and connection.settings_dict['CONN_MAX_AGE'] == 0:
+            continue
+        try:
+            connection.ensure_connection()
+        except DatabaseError as error:
+            # Недоступная база не должна мешать запуску воркера.
+            logger.warning('Прогрев: нет соединения с %s: %s',
+                           connection.alias, error)
+
+
+def host():
+    """Имя хоста для синтетических запросов, разрешённое ALLOWED_HOSTS."""
+    for allowed in settings.ALLOWED_HOSTS:
+        if allowed != '*' and not allowed.startswith('.'):
+            return allowed
+    return 'localhost'
+
+
+def wsgi_request(application, path):
+    """Выполняет GET-запрос к WSGI-приложению; возвращает код ответа."""
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': path,
+        'QUERY_STRING': '',
+        'SERVER_NAME': host(),
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': host(),
+        WARMUP_KEY: True,
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    statuses = []
+    response = application(
+        environ, lambda status, headers, exc_info=None: statuses.append(status)
+    )
+    try:
+        for _ in response:
+            pass
+    finally:
+        response.close()
+    return int(statuses[0].split()[0])
+
+
+def asgi_request(application, path):
+    """Выполняет GET-запрос к ASGI-приложению; возвращает код ответа."""
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': [(b'host', host().encode())],
+        WARMUP_KEY: True,
+        'client': ('127.0.0.1', 0),
+        'server': (host(), 80),
+    }
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(application(scope, receive, send))
+    return messages[0]['status']
+
+
+def warm_up(application=None):
+    """Прогревает процесс; возвращает время шагов в секундах.
+
+    application — WSGI- или ASGI-приложение, через которое проходят
+    синтетические запросы к NOTES_WARMUP_URLS; без него запросы
+    не выполняются.
+    """
+    started = time.perf_counter()
+    report = {}
+    with timed(report, 'urls'):
+        resolve_urls()
+    with timed(report, 'templates'):
+        compile_templates()
+    with timed(report, 'databases'):
+        connect_databases()
+    if application is not None:
+        is_asgi = asyncio.iscoroutinefunction(application.__call__)
+        request = asgi_request if is_asgi else wsgi_request
+        for name in settings.NOTES_WARMUP_URLS:
+            try:
+                path = reverse(name)
+            except NoReverseMatch:
+                logger.exception('Прогрев: адрес %s не найден.', name)
+                continue
+            with timed(report, f'GET {path}'):
+                status = request(application, path)
+                if status >= 500:
+                    logger.warning('Прогрев: %s вернул %s.', path, status)
+    # Соединения этого потока не достанутся потокам и процессам воркеров.
+    connections.close_all()
+    report['total'] = time.perf_counter() - started
+    logger.info('Прогрев завершён: %s.', ', '.join(
+        f'{step} {seconds * 1000:.1f} мс' for step, seconds in report.items()
+    ))
+    return report
+
+
+def open_persistent_connections():
+    """Заранее открывает постоянные соединения в процессе воркера."""
+    connect_databases(persistent_only=True)
+
+
+def warm_up_in_thread(application):
+    """Прогревает ASGI-приложение вне цикла событий сервера.
+
+    Django запрещает синхронную работу с базой внутри работающего цикла
+    событий, а сервер может импортировать приложение уже из него.
+    Соединения заранее не открываются: заранее неизвестно, в каком потоке
+    будет выполняться синхронный код запросов.
+    """
+    reports = []
+    worker = threading.Thread(
+        target=lambda: reports.append(warm_up(application))
+    )
+    worker.start()
+    worker.join()
+    return reports[0] if reports else None
@@ -22,11 +22,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'notes.middleware.TraceRecordingMiddleware',
+    'notes.middleware.LoadSheddingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'notes.middleware.ReplicaStickinessMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'notes.middleware.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -44,6 +48,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'notes.context_processors.note_stats',
             ],
         },
     },
@@ -59,6 +64,40 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения. Для локальной проверки добавьте в DATABASES
+#     'replica': {
+#         'ENGINE': 'django.db.backends.sqlite3',
+#         'NAME': BASE_DIR / 'db.replica.sqlite3',
+#         'TEST': {'MIRROR': 'default'},
+#     },
+# укажите ['replica'] здесь и копируйте базу командой sync_replicas.
+DATABASE_REPLICAS = []
+DATABASE_ROUTERS = [
+    'notes.routers.ShardRouter',
+    'notes.routers.ReplicaRouter',
+]
+# Сколько секунд после изменяющего запроса читать из основной базы.
+NOTES_REPLICA_STICKY_SECONDS = 10
+# Через сколько секунд снова проверять недоступную реплику.
+NOTES_REPLICA_RETRY_SECONDS = 30
+# Сколько секунд считать доступной реплику, прошедшую проверку.
+NOTES_REPLICA_CHECK_SECONDS = 5
+# Базы данных, по которым распределяются данные пользователей.
+# Перед добавлением шарда все пользователи должны получить запись в
+# справочнике: python manage.py move_user_shard --pin-all
+NOTES_SHARDS = ['default']
+# Сколько секунд процессы кешируют справочник шардов.
+NOTES_SHARD_CACHE_TIMEOUT = 60
+
+
+# В продакшене здесь должен быть общий для всех воркеров бэкенд
+# (Memcached или Redis), иначе у каждого процесса будет свой кеш.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -87,3 +126,68 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_URL = reverse_lazy('users:login')
 LOGIN_REDIRECT_URL = reverse_lazy('notes:home')
+
+NOTES_ATTACHMENTS_ROOT = BASE_DIR / 'media' / 'attachments'
+# Отдача вложений фронтенд-сервером: None, 'x-sendfile' (Apache, lighttpd)
+# или 'x-accel-redirect' (nginx, требует internal location с префиксом ниже).
+NOTES_ATTACHMENTS_SENDFILE = None
+NOTES_ATTACHMENTS_ACCEL_PREFIX = '/protected/attachments/'
+# Файл без ссылок не удаляется, пока с его изменения не прошло столько
+# секунд: за это время сохраняется запись о новом вложении с тем же файлом.
+NOTES_ATTACHMENTS_BLOB_GRACE = 60 * 60
+# Загрузку по частям без новых частей столько секунд удаляет purge_notes.
+NOTES_UPLOAD_EXPIRY = 24 * 60 * 60
+
+# Максимальное число заметок у пользователя; None — без ограничений.
+NOTES_MAX_PER_USER = None
+
+# Публичные ссылки на заметки.
+NOTES_SHARE_CACHE = 'default'
+NOTES_SHARE_CACHE_TIMEOUT = 24 * 60 * 60
+NOTES_SHARE_MAX_AGE = 0
+NOTES_SHARE_S_MAXAGE = 300
+
+# Предел подсчёта строк на страницах списков в админке.
+NOTES_ADMIN_COUNT_LIMIT = 10000
+
+# Поиск: минимальное сходство заголовков по триграммам и текстов по
+# словосочетаниям, при котором заметки считаются похожими.
+NOTES_TITLE_SIMILARITY = 0.3
+NOTES_DUPLICATE_SIMILARITY = 0.7
+
+# Фоновые задачи (manage.py run_workers).
+NOTES_TASK_MAX_ATTEMPTS = 5
+# Задержка перед повтором: base * 2 ** (попытка - 1), но не больше max.
+NOTES_TASK_RETRY_BASE = 5
+NOTES_TASK_RETRY_MAX = 60 * 60
+# Через сколько секунд задача зависшего воркера возвращается в очередь.
+NOTES_TASK_STALE_TIMEOUT = 10 * 60
+
+# Ограничение частоты изменяющих запросов по имени URL: для пользователя
+# ('user') и для IP ('ip'). Лимит '30/m' — не больше 30 запросов подряд
+# и 30 в минуту в среднем; периоды: s, m, h, d (или second, minute, hour,
+# day). GET и другие безопасные запросы не ограничиваются никогда.
+NOTES_RATE_LIMITS = {
+    'notes:add': {'user': '30/m', 'ip': '60/m'},
+    'users:login': {'ip': '10/m'},
+    'users:signup': {'ip': '5/h'},
+}
+NOTES_RATE_LIMIT_CACHE = 'default'
+# Число доверенных прокси перед приложением, дописывающих адрес в
+# X-Forwarded-For; 0 — IP клиента берётся из REMOTE_ADDR.
+NOTES_RATE_LIMIT_TRUSTED_PROXIES = 0
+
+# Сброс нагрузки: предел одновременных запросов в процессе и времени
+# ожидания в очереди фронтенд-сервера (X-Request-Start); None — без предела.
+NOTES_SHED_MAX_IN_FLIGHT = None
+NOTES_SHED_MAX_QUEUE_SECONDS = None
+NOTES_SHED_RETRY_AFTER = 5
+
+# Прогрев воркера при создании WSGI/ASGI-приложения (notes/warmup.py):
+# страницы из списка запрашиваются анонимно до первого реального запроса.
+NOTES_WARMUP = True
+NOTES_WARMUP_URLS = ['notes:home', 'users:login']
+
+# Запись запросов для manage.py replay_traffic: путь к файлу трассы
+# или None, чтобы не записывать.
+NOTES_TRACE_FILE = None
@@ -9,8 +9,16 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/wsgi/
 
 import os
 
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yanote.settings')
 
 application = get_wsgi_application()
+
+if settings.NOTES_WARMUP:
+    from notes.warmup import open_persistent_connections, warm_up
+    warm_up(application)
+    # При gunicorn --preload соединения открываются в каждом воркере.
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=open_persistent_connections)